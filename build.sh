@@ -15,6 +15,10 @@ python manage.py collectstatic --noinput
 echo "🗄️ Running database migrations..."
 python manage.py migrate --noinput
 
+# Check deployment settings (e.g. a shared cache)
+echo "🔍 Checking deployment settings..."
+python manage.py check --deploy
+
 # Create superuser (optional - will skip if exists)
 echo "👤 Creating superuser..."
 python manage.py shell << EOF
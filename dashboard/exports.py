@@ -0,0 +1,123 @@
+"""
+Streaming exports of a store's orders and products as CSV or JSON Lines.
+
+Rows come straight from values_list(...).iterator(), so only one chunk of
+the result is in memory at a time however large the store is. Orders are
+joined to their items in the same query: CSV gets one line per order item,
+JSON Lines one object per order with its items nested. CSV text cells that
+a spreadsheet would evaluate as formulas are prefixed with a quote.
+
+Used by the dashboard export view and `manage.py export_store`.
+"""
+import csv
+import json
+from itertools import chain, groupby, islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from shop.models import Order, Product
+
+KINDS = ['orders', 'products']
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+ORDER_COLUMNS = ['id', 'created_at', 'status', 'customer', 'total_amount', 'shipping_address']
+ITEM_COLUMNS = ['product_id', 'product_name', 'quantity', 'price']
+PRODUCT_COLUMNS = ['id', 'name', 'slug', 'category', 'price', 'stock', 'available', 'created_at']
+
+# Lines per chunk handed to the response / file
+LINES_PER_CHUNK = 500
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+
+def order_rows(store):
+    """One row per order item (item columns are None for orders without items)"""
+    return (
+        Order.objects.filter(store=store).order_by('id')
+        .values_list(
+            'id', 'created_at', 'status', 'user__username', 'total_amount', 'shipping_address',
+            'items__product_id', 'items__product__name', 'items__quantity', 'items__price',
+        )
+        .iterator(chunk_size=_chunk_size())
+    )
+
+
+def product_rows(store):
+    return (
+        Product.objects.filter(store=store).order_by('id')
+        .values_list('id', 'name', 'slug', 'category__name', 'price', 'stock', 'available', 'created_at')
+        .iterator(chunk_size=_chunk_size())
+    )
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    """Quote text a spreadsheet would read as a formula (CSV injection)"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def _json_line(record):
+    return json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+def _order_records(rows):
+    order_width = len(ORDER_COLUMNS)
+    for order_id, group in groupby(rows, key=lambda row: row[0]):
+        first = next(group)
+        record = dict(zip(ORDER_COLUMNS, first[:order_width]))
+        record['items'] = [
+            dict(zip(ITEM_COLUMNS, row[order_width:]))
+            for row in chain([first], group)
+            if row[order_width] is not None
+        ]
+        yield record
+
+
+def export_lines(store, kind, fmt):
+    """Yield the export of `kind` ('orders' or 'products') line by line"""
+    if kind == 'orders':
+        if fmt == 'csv':
+            return _csv_lines(ORDER_COLUMNS + ITEM_COLUMNS, order_rows(store))
+        return map(_json_line, _order_records(order_rows(store)))
+    if kind == 'products':
+        if fmt == 'csv':
+            return _csv_lines(PRODUCT_COLUMNS, product_rows(store))
+        return (_json_line(dict(zip(PRODUCT_COLUMNS, row))) for row in product_rows(store))
+    raise ValueError(f'Unknown export: {kind}')
+
+
+def export_chunks(store, kind, fmt):
+    """Like export_lines, but joined into a few hundred lines per chunk"""
+    lines = export_lines(store, kind, fmt)
+    while chunk := ''.join(islice(lines, LINES_PER_CHUNK)):
+        yield chunk
+
+
+def export_filename(store, kind, fmt):
+    return f'{store.slug}-{kind}.{fmt}'
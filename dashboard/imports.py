@@ -0,0 +1,228 @@
+"""
+Bulk product import from CSV or JSON Lines.
+
+Rows are read one at a time from the upload (never the whole file) and
+written in chunks: per chunk, one query finds which slugs already exist, then
+bulk_update/bulk_create write them (an upsert on (slug, store)) and the search
+index is updated in one batch. Categories are resolved by slug from a map
+loaded once per import; unknown ones are created with one bulk_create.
+
+Columns: name, price (required), slug, description, stock, available,
+category. Without a slug, one is made from the name, with -2, -3... suffixes
+for repeats within the file, so re-importing a file updates the same products.
+
+Used by the dashboard import view and `manage.py import_products`.
+"""
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from shop import versions
+from shop.models import Category, Product
+from shop.search import get_backend
+
+FORMATS = ['csv', 'jsonl']
+UPDATE_FIELDS = ['name', 'description', 'price', 'stock', 'available', 'category', 'updated_at']
+DEFAULT_CATEGORY = 'Uncategorized'
+MAX_PRICE = Decimal('99999999.99')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off', ''}
+
+# Errors kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(lines, fmt):
+    """Yield (line number, row dict) from an iterable of text lines"""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else ValueError('not a JSON object')
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f'invalid available value {value!r}')
+
+
+class ImportReport:
+    """Running totals of an import, passed to the progress callback"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, str(message)))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f'{self.rows} rows: {self.created} created, {self.updated} updated, '
+                f'{self.error_count} errors ({self.rows_per_second:.0f} rows/sec)')
+
+
+class ProductImporter:
+    def __init__(self, store, chunk_size=None, progress=None):
+        self.store = store
+        self.chunk_size = chunk_size or getattr(settings, 'PRODUCT_IMPORT_CHUNK_SIZE', 1000)
+        self.progress = progress
+        self.report = ImportReport()
+        self.categories = dict(Category.objects.filter(store=store).values_list('slug', 'id'))
+        self.slugs = set()
+
+    def run(self, rows):
+        """Import (line number, row) pairs; returns the ImportReport"""
+        started = time.monotonic()
+        rows = iter(rows)
+        try:
+            while chunk := list(islice(rows, self.chunk_size)):
+                self._import_chunk(chunk)
+                self.report.elapsed = time.monotonic() - started
+                if self.progress:
+                    self.progress(self.report)
+        finally:
+            if self.report.created or self.report.updated:
+                versions.bump_on_commit(self.store.pk)
+        return self.report
+
+    def _unique_slug(self, row):
+        explicit = str(row.get('slug') or '').strip()
+        base = slugify(explicit or row['name'])[:190]
+        if not base:
+            raise ValueError('name does not produce a usable slug')
+        slug = base
+        if explicit:
+            if slug in self.slugs:
+                raise ValueError(f'duplicate slug {slug!r}')
+        else:
+            suffix = 2
+            while slug in self.slugs:
+                slug = f'{base}-{suffix}'
+                suffix += 1
+        self.slugs.add(slug)
+        return slug
+
+    def _clean(self, row):
+        if isinstance(row, Exception):
+            raise row
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise ValueError('name is required')
+        try:
+            price = Decimal(str(row.get('price', '')).strip()).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f'invalid price {row.get("price")!r}')
+        if not price.is_finite() or not Decimal(0) <= price <= MAX_PRICE:
+            raise ValueError(f'price out of range {price}')
+        try:
+            stock = int(row.get('stock') or 0)
+        except (TypeError, ValueError):
+            stock = -1
+        if stock < 0:
+            raise ValueError(f'invalid stock {row.get("stock")!r}')
+        available = _parse_bool(row.get('available', True))
+        category = str(row.get('category') or '').strip() or DEFAULT_CATEGORY
+        return {
+            'name': name[:200],
+            'description': str(row.get('description') or ''),
+            'price': price,
+            'stock': stock,
+            'available': available,
+            'category': (slugify(category) or slugify(DEFAULT_CATEGORY), category[:200]),
+            # Last, so a row that fails validation doesn't claim a slug
+            'slug': self._unique_slug(row | {'name': name}),
+        }
+
+    def _resolve_categories(self, cleaned):
+        missing = {}
+        for row in cleaned:
+            slug, name = row['category']
+            if slug not in self.categories:
+                missing.setdefault(slug, name)
+        if missing:
+            Category.objects.bulk_create(
+                [Category(store=self.store, slug=slug, name=name) for slug, name in missing.items()],
+                ignore_conflicts=True
+            )
+            self.categories.update(
+                Category.objects.filter(store=self.store, slug__in=missing).values_list('slug', 'id')
+            )
+
+    def _import_chunk(self, chunk):
+        cleaned = []
+        for line, row in chunk:
+            self.report.rows += 1
+            try:
+                cleaned.append(self._clean(row))
+            except ValueError as e:
+                self.report.add_error(line, e)
+        if not cleaned:
+            return
+
+        now = timezone.now()
+        with transaction.atomic():
+            self._resolve_categories(cleaned)
+            existing = {
+                product.slug: product
+                for product in Product.objects.filter(store=self.store, slug__in=[row['slug'] for row in cleaned])
+            }
+            new, changed = [], []
+            for row in cleaned:
+                row['category_id'] = self.categories[row.pop('category')[0]]
+                product = existing.get(row['slug'])
+                if product is None:
+                    new.append(Product(store=self.store, **row))
+                    continue
+                for field, value in row.items():
+                    setattr(product, field, value)
+                product.updated_at = now
+                changed.append(product)
+            Product.objects.bulk_create(new)
+            if new and new[0].pk is None:
+                # Backends that can't return ids from a bulk insert
+                new = list(Product.objects.filter(store=self.store, slug__in=[product.slug for product in new]))
+            Product.objects.bulk_update(changed, UPDATE_FIELDS)
+            get_backend().index_many(new + changed)
+
+        self.report.created += len(new)
+        self.report.updated += len(changed)
+
+
+def import_products(store, lines, fmt='csv', **options):
+    """Import products into `store` from text lines; returns the ImportReport"""
+    return ProductImporter(store, **options).run(read_rows(lines, fmt))
@@ -0,0 +1,34 @@
+"""
+Management command to export a store's orders or products as CSV or JSON
+Lines, streaming rows so memory use stays flat for any store size
+"""
+from django.core.management.base import BaseCommand, CommandError
+from shop.models import Store
+from dashboard.exports import KINDS, FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = "Export a store's orders or products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('store', help='Store slug')
+        parser.add_argument('kind', choices=KINDS)
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            raise CommandError(f'Store "{options["store"]}" does not exist')
+
+        chunks = export_chunks(store, options['kind'], options['format'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'[OK] Exported {options["kind"]} to {options["output"]}'))
@@ -0,0 +1,37 @@
+"""
+Management command to create or update a store's products in bulk from a
+CSV or JSON Lines file
+"""
+from django.core.management.base import BaseCommand, CommandError
+from shop.models import Store
+from dashboard.imports import FORMATS, guess_format, import_products
+
+
+class Command(BaseCommand):
+    help = "Import products into a store from CSV or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('store', help='Store slug')
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, help='Rows per batch')
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(slug=options['store'])
+        except Store.DoesNotExist:
+            raise CommandError(f'Store "{options["store"]}" does not exist')
+
+        fmt = options['format'] or guess_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                report = import_products(store, lines, fmt, chunk_size=options['chunk_size'],
+                                         progress=lambda report: self.stdout.write(report.summary()))
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, error in report.errors:
+            self.stdout.write(self.style.WARNING(f'line {line}: {error}'))
+        if report.error_count > len(report.errors):
+            self.stdout.write(self.style.WARNING(f'... and {report.error_count - len(report.errors)} more errors'))
+        self.stdout.write(self.style.SUCCESS(f'[OK] {report.summary()}'))
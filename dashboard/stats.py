@@ -0,0 +1,69 @@
+"""
+Store dashboard statistics, read from the StoreDailyStats rollups so the
+cost depends on how many days a store has traded, not how many orders
+it has taken
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from shop import versions
+from shop.models import Product, Store, StoreDailyStats
+
+SERIES_WINDOWS = [7, 30, 365]
+
+
+def kpi_cache_key(store_id):
+    current = versions.get_versions(store_id, [versions.CATALOG, versions.ORDERS])
+    return f'dashboard:kpis:{store_id}:{current[versions.CATALOG]}:{current[versions.ORDERS]}'
+
+
+def store_kpis(store):
+    """
+    Return the headline numbers for a store's dashboard:
+    total_orders, total_revenue, total_products and pending_orders.
+
+    Computed in a single query (sums over the daily rollups, products
+    counted in a subquery so the joins don't multiply) and cached until the
+    store's catalog or orders change, for at most DASHBOARD_KPI_TIMEOUT
+    seconds.
+    """
+    key = kpi_cache_key(store.pk)
+    kpis = cache.get(key)
+    if kpis is None:
+        product_count = (
+            Product.objects.filter(store=OuterRef('pk'))
+            .order_by().values('store').annotate(count=Count('id')).values('count')
+        )
+        kpis = Store.objects.filter(pk=store.pk).annotate(
+            total_orders=Coalesce(Sum('daily_stats__orders'), 0),
+            total_revenue=Sum('daily_stats__revenue'),
+            pending_orders=Coalesce(Sum('daily_stats__pending'), 0),
+            total_products=Coalesce(Subquery(product_count, output_field=IntegerField()), 0),
+        ).values('total_orders', 'total_revenue', 'total_products', 'pending_orders').get()
+        kpis['total_revenue'] = kpis['total_revenue'] or 0
+        cache.set(key, kpis, getattr(settings, 'DASHBOARD_KPI_TIMEOUT', 60))
+    return kpis
+
+
+def sales_series(store, days):
+    """
+    Return one {'date', 'orders', 'revenue', 'items_sold'} dict per day for
+    the last `days` days (today included), with zeros for days without sales.
+    """
+    today = timezone.localdate()
+    start = today - timedelta(days=days - 1)
+    rows = {
+        row['date']: row
+        for row in StoreDailyStats.objects.filter(store=store, date__gte=start)
+        .values('date', 'orders', 'revenue', 'items_sold')
+    }
+    series = []
+    for offset in range(days):
+        date = start + timedelta(days=offset)
+        series.append(rows.get(date, {'date': date, 'orders': 0, 'revenue': 0, 'items_sold': 0}))
+    return series
@@ -0,0 +1,68 @@
+"""
+Paginated, sortable dashboard tables.
+
+Every sort ends in id so it can be keyset-paginated (shop.pagination), and
+each one is backed by a (store, ...) index on the model, so a page costs the
+same on the first screen as on the thousandth.
+"""
+from django.http import JsonResponse
+from django.template.loader import render_to_string
+
+ROWS_PER_PAGE = 50
+
+PRODUCT_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'stock': ('stock', 'id'),
+    '-stock': ('-stock', '-id'),
+}
+
+ORDER_SORTS = {
+    '-date': ('-created_at', '-id'),
+    'date': ('created_at', 'id'),
+    'total': ('total_amount', 'id'),
+    '-total': ('-total_amount', '-id'),
+}
+
+
+def get_sort(request, sorts, default='newest'):
+    sort = request.GET.get('sort')
+    return sort if sort in sorts else default
+
+
+def table_url(request, **params):
+    """Current URL's query string with `params` replaced (None removes)"""
+    query = request.GET.copy()
+    query.pop('format', None)
+    for key, value in params.items():
+        query.pop(key, None)
+        if value is not None:
+            query[key] = value
+    return f'?{query.urlencode()}'
+
+
+def sort_links(request, columns, current):
+    """Link for each column header: sort by it, or reverse it if it's current"""
+    return {
+        column: table_url(request, sort=f'-{column}' if current == column else column, after=None)
+        for column in columns
+    }
+
+
+def table_context(request, page):
+    return {
+        'page': page,
+        'next_url': table_url(request, after=page.next_cursor) if page.has_next() else None,
+    }
+
+
+def rows_response(request, rows_template, context):
+    """JSON for the "Load more" button: the next rows as HTML plus the next page URL"""
+    return JsonResponse({
+        'html': render_to_string(rows_template, context, request=request),
+        'count': len(context['page']),
+        'next_url': context['next_url'],
+    })
@@ -0,0 +1,44 @@
+"""
+Background tasks for the store dashboard (run by `manage.py run_worker`)
+"""
+import csv
+import io
+import uuid
+
+from django.core.files.storage import default_storage
+
+from shop.models import Store, Task
+from shop.taskqueue import task
+from .imports import import_products
+
+IMPORT_KEY_PREFIX = 'imports'
+
+
+def _import_key_prefix(store_id):
+    return f'{IMPORT_KEY_PREFIX}:{store_id}:'
+
+
+def queue_import(store, path, fmt):
+    """Queue an import of an uploaded file; its key ties the Task to the store"""
+    return import_products_file.enqueue(args=[store.pk, path, fmt],
+                                        key=f'{_import_key_prefix(store.pk)}{uuid.uuid4().hex}')
+
+
+def last_import(store):
+    """The store's most recent import Task (found through the key's unique index), or None"""
+    return Task.objects.filter(key__startswith=_import_key_prefix(store.pk)).order_by('-id').first()
+
+
+@task
+def import_products_file(store_id, path, fmt):
+    """Import an uploaded product file, then delete it"""
+    store = Store.objects.get(pk=store_id)
+    try:
+        with default_storage.open(path, 'rb') as upload:
+            report = import_products(store, io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''), fmt)
+    except (UnicodeDecodeError, csv.Error) as e:
+        # Retrying won't fix a malformed file
+        default_storage.delete(path)
+        return {'error': f'Could not read the file: {e}'}
+    default_storage.delete(path)
+    return {'summary': report.summary(), 'errors': report.errors[:10]}
@@ -1,4 +1,256 @@
 # Dashboard tests
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from shop.models import Category, Product, Order, OrderItem
+from .stats import store_kpis, sales_series
+from shop.models import Task
+from shop.search import search_products
+from shop.taskqueue import Worker
+from shop.testing import ShopTestMixin, TempMediaMixin
+from .imports import import_products
+from .tasks import last_import
+from .tables import ROWS_PER_PAGE
+
+
+class DashboardTestMixin(ShopTestMixin):
+    """Builds stores (see shop.testing) and their orders"""
+
+    def create_orders(self, store, count, status='pending', amount='10.00'):
+        customer, _ = User.objects.get_or_create(username='customer')
+        return [
+            Order.objects.create(user=customer, store=store, status=status,
+                                 total_amount=Decimal(amount), shipping_address='Somewhere')
+            for _ in range(count)
+        ]
+
+
+class StoreKpiTests(DashboardTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store, self.category = self.create_store()
+
+    def test_kpis_take_one_query_and_are_cached(self):
+        for i in range(3):
+            Product.objects.create(name=f'Product {i}', description='x', price=1, stock=1,
+                                   category=self.category, store=self.store)
+        self.create_orders(self.store, 5, status='pending')
+        self.create_orders(self.store, 20, status='delivered', amount='2.50')
+        other_store, _ = self.create_store('Other Store')
+        self.create_orders(other_store, 4)
+
+        with self.assertNumQueries(1):
+            kpis = store_kpis(self.store)
+        self.assertEqual(kpis, {
+            'total_orders': 25,
+            'total_revenue': Decimal('100.00'),
+            'total_products': 3,
+            'pending_orders': 5,
+        })
+        with self.assertNumQueries(0):
+            store_kpis(self.store)
+
+    def test_store_without_orders_or_products(self):
+        self.assertEqual(store_kpis(self.store), {
+            'total_orders': 0,
+            'total_revenue': 0,
+            'total_products': 0,
+            'pending_orders': 0,
+        })
+
+    def test_sales_series_has_one_row_per_day(self):
+        self.create_orders(self.store, 3, amount='5.00')
+        with self.assertNumQueries(1):
+            series = sales_series(self.store, 7)
+        self.assertEqual(len(series), 7)
+        self.assertEqual(series[-1]['date'], timezone.localdate())
+        self.assertEqual((series[-1]['orders'], series[-1]['revenue']), (3, Decimal('15.00')))
+        self.assertEqual([day['orders'] for day in series[:-1]], [0] * 6)
+
+
+class DashboardTableTests(DashboardTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.client.force_login(self.store.owner)
+
+    def fetch_rows(self, name, url=None, **params):
+        url = url or reverse(f'dashboard:{name}', args=[self.store.slug])
+        response = self.client.get(url, {**params, 'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_orders_load_a_page_at_a_time(self):
+        orders = self.create_orders(self.store, ROWS_PER_PAGE + 5)
+        first = self.fetch_rows('store_orders')
+        self.assertEqual(first['count'], ROWS_PER_PAGE)
+        self.assertIn(f'#{orders[-1].id}<', first['html'])
+
+        url = reverse('dashboard:store_orders', args=[self.store.slug]) + first['next_url']
+        second = self.client.get(url + '&format=json').json()
+        self.assertEqual(second['count'], 5)
+        self.assertIsNone(second['next_url'])
+        self.assertIn(f'#{orders[0].id}<', second['html'])
+
+    def test_orders_sorted_by_total_within_status(self):
+        for amount in ['30.00', '10.00', '20.00']:
+            self.create_orders(self.store, 1, status='shipped', amount=amount)
+        self.create_orders(self.store, 1, status='pending', amount='5.00')
+        html = self.fetch_rows('store_orders', status='shipped', sort='total')['html']
+        positions = [html.index(f'${amount}') for amount in ['10.00', '20.00', '30.00']]
+        self.assertEqual(positions, sorted(positions))
+        self.assertNotIn('$5.00', html)
+
+    def test_products_sorted_by_price(self):
+        for price in ['3.00', '1.00', '2.00']:
+            Product.objects.create(name=f'Product {price}', description='x', price=Decimal(price),
+                                   stock=1, category=self.category, store=self.store)
+        html = self.fetch_rows('store_products', sort='-price')['html']
+        positions = [html.index(f'Product {price}') for price in ['3.00', '2.00', '1.00']]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_category_filter(self):
+        other = Category.objects.create(name='Other', store=self.store)
+        for name, category in [('Lamp general', self.category), ('Lamp other', other)]:
+            Product.objects.create(name=name, description='x', price=Decimal('1.00'),
+                                   stock=1, category=category, store=self.store)
+        for search in ['', 'lamp']:
+            html = self.fetch_rows('store_products', search=search, category=other.id)['html']
+            self.assertIn('Lamp other', html)
+            self.assertNotIn('Lamp general', html)
+            for bad in ['abc', '1' * 40, '²']:
+                html = self.fetch_rows('store_products', search=search, category=bad)['html']
+                self.assertIn('Lamp general', html)
+
+    def test_invalid_cursor_is_not_found(self):
+        url = reverse('dashboard:store_orders', args=[self.store.slug])
+        self.assertEqual(self.client.get(url, {'after': 'nonsense'}).status_code, 404)
+
+
+class ExportTests(DashboardTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.client.force_login(self.store.owner)
+        self.product = Product.objects.create(name='Widget, large', description='x', price=Decimal('4.00'),
+                                              stock=5, category=self.category, store=self.store)
+        self.with_items, self.without_items = self.create_orders(self.store, 2, amount='8.00')
+        OrderItem.objects.create(order=self.with_items, product=self.product, quantity=2, price=Decimal('4.00'))
+        other_store, _ = self.create_store('Other Store')
+        self.create_orders(other_store, 1)
+
+    def export(self, kind, fmt):
+        url = reverse('dashboard:store_export', args=[self.store.slug, kind])
+        response = self.client.get(url, {'format': fmt})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_has_a_line_per_item(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('orders', 'csv'))))
+        self.assertEqual([row['id'] for row in rows], [str(self.with_items.id), str(self.without_items.id)])
+        self.assertEqual((rows[0]['product_name'], rows[0]['quantity']), ('Widget, large', '2'))
+        self.assertEqual(rows[1]['product_id'], '')
+
+    def test_orders_jsonl_nests_items(self):
+        records = [json.loads(line) for line in self.export('orders', 'jsonl').splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['items'], [
+            {'product_id': self.product.id, 'product_name': 'Widget, large', 'quantity': 2, 'price': '4.00'}
+        ])
+        self.assertEqual(records[1]['items'], [])
+
+    def test_products_export_and_unknown_kind(self):
+        rows = list(csv.reader(io.StringIO(self.export('products', 'csv'))))
+        self.assertEqual(rows[1][:2], [str(self.product.id), 'Widget, large'])
+        url = reverse('dashboard:store_export', args=[self.store.slug, 'users'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_csv_cells_are_not_formulas(self):
+        Product.objects.filter(pk=self.product.pk).update(name='=HYPERLINK("http://evil")')
+        self.with_items.shipping_address = '@SUM(1+1)'
+        self.with_items.save()
+        products = list(csv.DictReader(io.StringIO(self.export('products', 'csv'))))
+        self.assertEqual(products[0]['name'], '\'=HYPERLINK("http://evil")')
+        self.assertEqual(products[0]['price'], '4.00')
+        orders = list(csv.DictReader(io.StringIO(self.export('orders', 'csv'))))
+        self.assertEqual(orders[0]['shipping_address'], "'@SUM(1+1)")
+        records = [json.loads(line) for line in self.export('orders', 'jsonl').splitlines()]
+        self.assertEqual(records[0]['shipping_address'], '@SUM(1+1)')
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('export_store', self.store.slug, 'products', format='jsonl', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['name'], 'Widget, large')
+
+
+class ImportTests(TempMediaMixin, DashboardTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store, self.category = self.create_store()
+
+    def csv_lines(self, rows):
+        return io.StringIO('name,price,stock,category,slug\n' + ''.join(f'{row}\n' for row in rows))
+
+    def test_creates_products_and_categories(self):
+        report = import_products(self.store, self.csv_lines([
+            'Red Shirt,10.00,5,Shirts,',
+            'Red Shirt,12.00,1,Shirts,',
+            'Blue Hat,3.5,0,General,',
+        ]))
+        self.assertEqual((report.rows, report.created, report.updated, report.error_count), (3, 3, 0, 0))
+        products = {p.slug: p for p in Product.objects.filter(store=self.store).select_related('category')}
+        self.assertEqual(set(products), {'red-shirt', 'red-shirt-2', 'blue-hat'})
+        self.assertEqual(products['red-shirt'].category.name, 'Shirts')
+        self.assertEqual(products['blue-hat'].category, self.category)
+        self.assertEqual(products['blue-hat'].price, Decimal('3.50'))
+        self.assertEqual([p.slug for p in search_products('shirt', store=self.store)].count('red-shirt'), 1)
+
+    def test_reimport_updates_by_slug(self):
+        import_products(self.store, self.csv_lines(['Widget,1.00,1,General,widget']))
+        report = import_products(self.store, self.csv_lines(['Widget v2,2.00,7,General,widget']))
+        self.assertEqual((report.created, report.updated), (0, 1))
+        product = Product.objects.get(store=self.store)
+        self.assertEqual((product.name, product.price, product.stock), ('Widget v2', Decimal('2.00'), 7))
+
+    def test_invalid_rows_are_reported_not_written(self):
+        report = import_products(self.store, self.csv_lines([
+            ',1.00,1,General,',
+            'Cheap,abc,1,General,',
+            'Fine,1.00,-3,General,',
+            'Good,1.00,1,General,',
+        ]))
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, error in report.errors], [2, 3, 4])
+
+    def test_queries_do_not_grow_per_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            report = import_products(self.store, self.csv_lines([f'Item {i},1.00,1,Other,' for i in range(300)]))
+        self.assertEqual(report.created, 300)
+        # A handful per chunk (SQLite splits big inserts to stay under its variable limit)
+        self.assertLess(len(queries), 20)
+
+    def test_jsonl_upload(self):
+        self.client.force_login(self.store.owner)
+        upload = SimpleUploadedFile('products.jsonl', b'{"name": "Lamp", "price": "9.99", "available": false}\nnot json\n')
+        response = self.client.post(reverse('dashboard:store_import_products', args=[self.store.slug]), {'file': upload})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Product.objects.filter(store=self.store).exists())
 
-# Create your tests here.
+        Worker(concurrency=1).run(burst=True)
+        self.assertFalse(Product.objects.get(store=self.store, slug='lamp').available)
+        result = Task.objects.get().result
+        self.assertIn('1 created', result['summary'])
+        self.assertEqual(last_import(self.store), Task.objects.get())
+        self.assertIsNone(last_import(self.create_store('Other Store')[0]))
+        self.assertEqual(result['errors'], [[2, 'not a JSON object']])
@@ -1,10 +1,22 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
+from django.core.files.storage import default_storage
+from django.http import Http404, StreamingHttpResponse
+from django.db.models import Count
 from django.utils import timezone
 from datetime import timedelta
 from shop.models import Product, Category, Order, OrderItem, Store, StoreTheme
+from shop.pagination import paginate_keyset, InvalidCursor
+from shop.search import search_page
+from .exports import KINDS, FORMATS, export_chunks, export_filename
+from .imports import FORMATS as IMPORT_FORMATS, guess_format
+from .tasks import last_import, queue_import
+from .stats import store_kpis, sales_series, SERIES_WINDOWS
+from .tables import (
+    ROWS_PER_PAGE, PRODUCT_SORTS, ORDER_SORTS,
+    get_sort, sort_links, table_context, rows_response,
+)
 import json
 
 
@@ -13,11 +25,13 @@ def store_dashboard(request, store_slug):
     """Store-specific dashboard for store owners"""
     store = get_object_or_404(Store, slug=store_slug, owner=request.user)
     
-    # Statistics for this store
-    total_orders = Order.objects.filter(store=store).count()
-    total_revenue = Order.objects.filter(store=store).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    total_products = Product.objects.filter(store=store).count()
-    pending_orders = Order.objects.filter(store=store, status='pending').count()
+    # Statistics for this store (one query over the daily rollups, cached briefly)
+    kpis = store_kpis(store)
+    
+    # Sales chart for the selected window
+    window = request.GET.get('window')
+    window = int(window) if window in [str(days) for days in SERIES_WINDOWS] else SERIES_WINDOWS[0]
+    sales = sales_series(store, window)
     
     # Recent orders for this store
     recent_orders = Order.objects.filter(store=store).select_related('user').order_by('-created_at')[:10]
@@ -27,10 +41,10 @@ def store_dashboard(request, store_slug):
     
     context = {
         'store': store,
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
-        'total_products': total_products,
-        'pending_orders': pending_orders,
+        **kpis,
+        'sales': sales,
+        'sales_window': window,
+        'sales_windows': SERIES_WINDOWS,
         'recent_orders': recent_orders,
         'low_stock_products': low_stock_products,
     }
@@ -39,26 +53,42 @@ def store_dashboard(request, store_slug):
 
 @login_required
 def store_manage_products(request, store_slug):
-    """Product management for specific store"""
+    """Product management for specific store, a sorted page of rows at a time"""
     store = get_object_or_404(Store, slug=store_slug, owner=request.user)
-    products = Product.objects.filter(store=store).select_related('category').order_by('-created_at')
+    products = Product.objects.filter(store=store).select_related('category')
     categories = Category.objects.filter(store=store)
     
-    # Search and filter
-    search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | Q(description__icontains=search_query)
-        )
+    # Search and filter; a category that isn't a valid id is ignored
+    category_id = request.GET.get('category', '')
+    category_id = int(category_id) if category_id.isdecimal() and len(category_id) <= 18 else None
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
     
-    category_filter = request.GET.get('category')
-    if category_filter:
-        products = products.filter(category_id=category_filter)
+    search_query = request.GET.get('search')
+    sort = get_sort(request, PRODUCT_SORTS)
+    try:
+        if search_query:
+            page = search_page(
+                search_query,
+                request.GET.get('after'),
+                ROWS_PER_PAGE,
+                store=store,
+                category_ids=[category_id] if category_id is not None else None
+            )
+        else:
+            page = paginate_keyset(products, request.GET.get('after'), ROWS_PER_PAGE, PRODUCT_SORTS[sort])
+    except InvalidCursor:
+        raise Http404('Invalid page')
     
+    context = {'store': store, 'products': page, **table_context(request, page)}
+    if request.GET.get('format') == 'json':
+        return rows_response(request, 'dashboard/includes/product_rows.html', context)
     return render(request, 'dashboard/store_products.html', {
-        'store': store,
-        'products': products,
-        'categories': categories
+        **context,
+        'categories': categories,
+        'last_import': last_import(store),
+        'sort': sort,
+        'sort_links': sort_links(request, ['name', 'price', 'stock'], sort),
     })
 
 
@@ -95,6 +125,21 @@ def store_add_product(request, store_slug):
     return redirect('store_manage_products', store_slug=store_slug)
 
 
+@login_required
+def store_import_products(request, store_slug):
+    """Queue an uploaded CSV/JSON Lines file for a bulk product import"""
+    store = get_object_or_404(Store, slug=store_slug, owner=request.user)
+    
+    upload = request.FILES.get('file')
+    if request.method == 'POST' and upload:
+        fmt = request.POST.get('format') or guess_format(upload.name)
+        path = default_storage.save(f'imports/{store.pk}/{upload.name}', upload)
+        queue_import(store, path, fmt if fmt in IMPORT_FORMATS else 'csv')
+        messages.success(request, 'Import started. Refresh this page to see the result.')
+    
+    return redirect('dashboard:store_products', store_slug=store_slug)
+
+
 @login_required
 def store_add_category(request, store_slug):
     """Add new category to specific store"""
@@ -156,18 +201,30 @@ def store_delete_product(request, store_slug, product_id):
 
 @login_required
 def store_manage_orders(request, store_slug):
-    """Order management for specific store"""
+    """Order management for specific store, a sorted page of rows at a time"""
     store = get_object_or_404(Store, slug=store_slug, owner=request.user)
-    orders = Order.objects.filter(store=store).select_related('user').order_by('-created_at')
+    orders = Order.objects.filter(store=store).select_related('user').annotate(
+        item_count=Count('items')
+    )
     
     # Filter by status
     status_filter = request.GET.get('status')
     if status_filter:
         orders = orders.filter(status=status_filter)
     
+    sort = get_sort(request, ORDER_SORTS, default='-date')
+    try:
+        page = paginate_keyset(orders, request.GET.get('after'), ROWS_PER_PAGE, ORDER_SORTS[sort])
+    except InvalidCursor:
+        raise Http404('Invalid page')
+    
+    context = {'store': store, 'orders': page, **table_context(request, page)}
+    if request.GET.get('format') == 'json':
+        return rows_response(request, 'dashboard/includes/order_rows.html', context)
     return render(request, 'dashboard/store_orders.html', {
-        'store': store,
-        'orders': orders
+        **context,
+        'sort': sort,
+        'sort_links': sort_links(request, ['date', 'total'], sort),
     })
 
 
@@ -190,11 +247,23 @@ def store_update_order_status(request, store_slug, order_id):
     return redirect('store_manage_orders', store_slug=store_slug)
 
 
+@login_required
+def store_export(request, store_slug, kind):
+    """Stream all of a store's orders or products as CSV or JSON Lines"""
+    store = get_object_or_404(Store, slug=store_slug, owner=request.user)
+    fmt = request.GET.get('format', 'csv')
+    if kind not in KINDS or fmt not in FORMATS:
+        raise Http404('Unknown export format')
+    response = StreamingHttpResponse(export_chunks(store, kind, fmt), content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(store, kind, fmt)}"'
+    return response
+
+
 @login_required
 def store_view_order(request, store_slug, order_id):
     """View order details for specific store"""
     store = get_object_or_404(Store, slug=store_slug, owner=request.user)
-    order = get_object_or_404(Order, id=order_id, store=store)
+    order = get_object_or_404(Order.objects.with_items(), id=order_id, store=store)
     return render(request, 'dashboard/store_order_detail.html', {
         'store': store,
         'order': order
@@ -206,16 +275,10 @@ def store_customize(request, store_slug):
     """Theme customization / Visual editor"""
     store = get_object_or_404(Store, slug=store_slug, owner=request.user)
     
-    # Get or create theme
-    theme, created = StoreTheme.objects.get_or_create(
-        store=store,
-        defaults={'sections': {}}
-    )
-    
-    # Initialize default sections if empty
-    if not theme.sections or theme.sections == {}:
+    # Nothing is written until the theme is saved
+    theme = StoreTheme.objects.filter(store=store).first() or StoreTheme(store=store)
+    if not theme.sections:
         theme.sections = theme.get_default_sections()
-        theme.save()
     
     if request.method == 'POST':
         # Save theme customization
@@ -236,6 +299,7 @@ def store_customize(request, store_slug):
             if 'logo' in request.FILES:
                 theme.logo = request.FILES['logo']
             
+            theme.full_clean()
             theme.save()
             messages.success(request, 'Theme updated successfully!')
         except Exception as e:
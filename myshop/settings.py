@@ -45,6 +45,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'shop.middleware.StoreMiddleware',  # Custom domain support
+    'shop.cart.CartMiddleware',  # request.cart
+    'shop.middleware.ConditionalStorefrontMiddleware',  # 304s for unchanged storefront pages
 ]
 
 ROOT_URLCONF = 'myshop.urls'
@@ -84,6 +86,86 @@ DATABASES = {
 }
 
 
+# Cache
+# Set REDIS_URL to share cached data (e.g. store routing) between workers;
+# otherwise each process keeps its own in-memory cache. Production needs the
+# shared cache: data versions (shop/versions.py) live there, and a bump in one
+# process must reach the others (`manage.py check --deploy` warns otherwise).
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Store routing cache (see shop/store_cache.py)
+STORE_CACHE_TIMEOUT = 300  # seconds in the shared cache
+STORE_CACHE_LOCAL_TIMEOUT = 30  # seconds in the per-process LRU
+STORE_CACHE_MAX_ENTRIES = 1024
+
+# Anonymous storefront page cache (see shop/page_cache.py)
+STOREFRONT_CACHE_TIMEOUT = 600
+
+# Rendered theme sections; keys change with their settings and data, so
+# this only bounds how long unused entries linger (see shop/sections.py)
+SECTION_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Product page ETag/Last-Modified state, cached per catalog version
+# (see shop/conditional.py)
+CATALOG_STATE_TIMEOUT = 60 * 60
+
+# Neighbours kept per product by `manage.py rebuild_related_products`
+# (see shop/related.py)
+RELATED_PRODUCTS_PER_PRODUCT = 8
+
+# Store dashboard headline numbers (see dashboard/stats.py)
+DASHBOARD_KPI_TIMEOUT = 60
+
+# Rows fetched per database round trip by order/product exports
+# (see dashboard/exports.py)
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows validated and written per batch by product imports
+# (see dashboard/imports.py)
+PRODUCT_IMPORT_CHUNK_SIZE = 1000
+
+# Background task queue (see shop/taskqueue.py); run `manage.py run_worker`.
+# TASK_QUEUE_EAGER runs tasks inline when enqueued, for setups without a worker.
+TASK_QUEUE_EAGER = os.environ.get('TASK_QUEUE_EAGER', 'False') == 'True'
+TASK_WORKER_CONCURRENCY = 4
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_DELAY = 10  # seconds, doubled after each failed attempt
+TASK_LOCK_TIMEOUT = 600  # seconds without a heartbeat before a running task counts as abandoned
+TASK_RETENTION = 7 * 24 * 60 * 60  # seconds done/failed tasks are kept before workers delete them
+TASK_PRUNE_INTERVAL = 60 * 60  # seconds between a worker's prune runs
+
+# Shopping carts (see shop/cart.py): CookieCartBackend keeps them in a signed
+# cookie, CacheCartBackend in the cache (needs a shared cache such as Redis),
+# SessionCartBackend in the session.
+CART_BACKEND = 'shop.cart.CookieCartBackend'
+CART_COOKIE_NAME = 'cart'
+CART_COOKIE_AGE = 60 * 60 * 24 * 30
+
+# Resized WebP/JPEG copies of product images and logos (see shop/images.py)
+IMAGE_DERIVATIVE_WIDTHS = [160, 320, 640, 1024]
+IMAGE_DERIVATIVE_QUALITY = 80
+# How long "no derivatives yet" is cached before storage is checked again
+IMAGE_MANIFEST_MISS_TIMEOUT = 60 * 60
+
+# StoreMiddleware: paths that never need request.store, and paths that are
+# refused when served from a store's custom domain
+STORE_MIDDLEWARE_EXEMPT_PATHS = ['/static/', '/media/', '/admin/', '/accounts/', '/dashboard/']
+STORE_MIDDLEWARE_BLOCKED_PATHS = ['/admin/', '/dashboard/', '/my-stores/', '/create-store/']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -122,13 +204,28 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Whitenoise static file serving
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STORAGES = {
+    # Uploads stored by content digest (see shop/storage.py)
+    'default': {'BACKEND': 'shop.storage.ContentAddressedStorage'},
+    # Whitenoise static file serving
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Upload directories whose files are deduplicated by content digest
+CONTENT_ADDRESSED_DIRS = ['products', 'store_logos', 'themes']
+
+# Let Django serve MEDIA_ROOT (blobs with immutable cache headers). On by
+# default only in development: in production a web server or CDN should serve
+# it and send "Cache-Control: public, max-age=31536000, immutable" for
+# /media/blobs/, plus "X-Content-Type-Options: nosniff" and, for anything but
+# images and CSS, "Content-Disposition: attachment" (as shop.storage.serve_media
+# does). Set SERVE_MEDIA=True to serve it from Django anyway.
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', str(DEBUG)) == 'True'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
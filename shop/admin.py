@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, Order, OrderItem, Store, StoreTheme
+from .models import Category, Product, Order, OrderItem, RelatedProduct, Store, StoreTheme, StoreDailyStats, Task
 
 
 @admin.register(Store)
@@ -17,7 +17,7 @@ class StoreThemeAdmin(admin.ModelAdmin):
     list_display = ['store', 'primary_color', 'layout_width', 'updated_at']
     list_filter = ['layout_width', 'updated_at']
     search_fields = ['store__name']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['stylesheet', 'section_plan', 'created_at', 'updated_at']
 
 
 
@@ -53,3 +53,28 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'user__email', 'store__name']
     inlines = [OrderItemInline]
     date_hierarchy = 'created_at'
+
+
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ['product', 'related', 'score']
+    list_select_related = ['product', 'related']
+    search_fields = ['product__name']
+    readonly_fields = ['product', 'related', 'score']
+
+
+@admin.register(StoreDailyStats)
+class StoreDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['store', 'date', 'orders', 'revenue', 'items_sold', 'pending', 'delivered']
+    list_filter = ['store']
+    date_hierarchy = 'date'
+    readonly_fields = ['store', 'date', 'orders', 'revenue', 'items_sold',
+                       'pending', 'processing', 'shipped', 'delivered', 'cancelled']
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'priority', 'attempts', 'run_at', 'updated_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'key']
+    readonly_fields = ['created_at', 'updated_at', 'locked_at', 'last_error', 'result']
@@ -0,0 +1,312 @@
+"""
+Shopping carts and the helpers shared by the cart, checkout and order views.
+
+A cart is just {product_id: quantity}; names and prices always come from the
+database when it is displayed (hydrate_cart). It is kept by a pluggable
+backend chosen with CART_BACKEND:
+
+- CookieCartBackend (default): a signed cookie. No server-side storage.
+- CacheCartBackend: the Django cache (use a shared one, e.g. Redis), keyed
+  by a random id in a signed cookie.
+- SessionCartBackend: the session; pair it with SESSION_ENGINE =
+  'django.contrib.sessions.backends.cached_db' so reads skip the database.
+
+With the first two, adding to or changing a cart writes nothing to the
+database. CartMiddleware loads request.cart on first use and saves it once
+per response, only if it changed.
+
+The unit count shown in the header is kept up to date as the cart changes
+and stored next to it (in the cache backend's cookie, in the session), so
+cart_count() can answer without loading the cart, and answers 0 without any
+lookup for visitors who have no cart cookie or session.
+"""
+import hashlib
+import secrets
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+COOKIE_SALT = 'shop.cart'
+
+# Keeps the cookie well under browsers' 4KB limit
+MAX_LINES = 200
+MAX_QUANTITY = 999
+
+
+def encode_lines(lines):
+    """{12: 3, 15: 1} -> '12:3,15:1'"""
+    return ','.join(f'{product_id}:{quantity}' for product_id, quantity in lines.items())
+
+
+def decode_lines(value):
+    """Inverse of encode_lines; malformed entries are dropped"""
+    lines = {}
+    for entry in (value or '').split(',')[:MAX_LINES]:
+        product_id, _, quantity = entry.partition(':')
+        if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+            lines[int(product_id)] = min(int(quantity), MAX_QUANTITY)
+    return lines
+
+
+class Cart:
+    """One visitor's cart: {product_id: quantity}"""
+
+    def __init__(self, lines=None):
+        self.lines = dict(lines or {})
+        # Total number of units, for the cart badge; kept in step by set()
+        self.count = sum(self.lines.values())
+        self.modified = False
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, product_id):
+        return int(product_id) in self.lines
+
+    def items(self):
+        return self.lines.items()
+
+    def quantity(self, product_id):
+        return self.lines.get(int(product_id), 0)
+
+    def set(self, product_id, quantity):
+        """Set a line's quantity; zero or less removes it"""
+        product_id = int(product_id)
+        if quantity > 0:
+            if product_id not in self.lines and len(self.lines) >= MAX_LINES:
+                return
+            quantity = min(quantity, MAX_QUANTITY)
+            self.count += quantity - self.lines.get(product_id, 0)
+            self.lines[product_id] = quantity
+        else:
+            self.count -= self.lines.pop(product_id, 0)
+        self.modified = True
+
+    def add(self, product_id, quantity=1):
+        self.set(product_id, self.quantity(product_id) + quantity)
+
+    def remove(self, product_id):
+        self.set(product_id, 0)
+
+    def clear(self):
+        self.lines = {}
+        self.count = 0
+        self.modified = True
+
+
+def _cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+
+def _cookie_age():
+    return getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+
+
+def _set_cookie(response, value):
+    response.set_cookie(
+        _cookie_name(), value,
+        max_age=_cookie_age(),
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+
+
+def _read_cookie(request):
+    value = request.COOKIES.get(_cookie_name())
+    if not value:
+        return None
+    try:
+        return signing.loads(value, salt=COOKIE_SALT, max_age=_cookie_age())
+    except signing.BadSignature:
+        return None
+
+
+class CookieCartBackend:
+    """The cart itself, signed, in a cookie"""
+
+    def load(self, request):
+        return decode_lines(_read_cookie(request))
+
+    def count(self, request):
+        return sum(self.load(request).values())
+
+    def save(self, request, response, lines):
+        if lines:
+            _set_cookie(response, signing.dumps(encode_lines(lines), salt=COOKIE_SALT, compress=True))
+        else:
+            response.delete_cookie(_cookie_name())
+
+
+class CacheCartBackend:
+    """
+    The cart in the cache, under a random id kept in a signed cookie
+    together with the cart's unit count and a digest of its contents:
+    '<id>:<count>:<digest>'. The digest changes the cookie whenever the cart
+    does, so pages validated against it (storefront ETags) aren't reused.
+    """
+
+    def _key(self, cart_id):
+        return f'shop:cart:{cart_id}'
+
+    def _read(self, request):
+        cart_id, _, count = (_read_cookie(request) or '').partition(':')
+        count = count.partition(':')[0]
+        return cart_id, int(count) if count.isdigit() else None
+
+    def load(self, request):
+        cart_id, _ = self._read(request)
+        return decode_lines(cache.get(self._key(cart_id))) if cart_id else {}
+
+    def count(self, request):
+        cart_id, count = self._read(request)
+        if count is None:
+            # Cookies set before the count was stored with the id
+            return sum(self.load(request).values()) if cart_id else 0
+        return count
+
+    def save(self, request, response, lines):
+        cart_id, _ = self._read(request)
+        if not lines:
+            if cart_id:
+                cache.delete(self._key(cart_id))
+                response.delete_cookie(_cookie_name())
+            return
+        if not cart_id:
+            cart_id = secrets.token_urlsafe(16)
+        encoded = encode_lines(lines)
+        cache.set(self._key(cart_id), encoded, _cookie_age())
+        # Re-sent on every change so the cookie expires with the cache entry
+        count = sum(lines.values())
+        digest = hashlib.md5(encoded.encode()).hexdigest()[:8]
+        _set_cookie(response, signing.dumps(f'{cart_id}:{count}:{digest}', salt=COOKIE_SALT))
+
+
+class SessionCartBackend:
+    """The cart in request.session, encoded compactly"""
+
+    def load(self, request):
+        value = request.session.get('cart')
+        if isinstance(value, dict):
+            # Carts saved before the compact encoding
+            return decode_lines(encode_lines({
+                product_id: item.get('quantity', 0) for product_id, item in value.items()
+            }))
+        return decode_lines(value)
+
+    def count(self, request):
+        if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+            # No session to load
+            return 0
+        count = request.session.get('cart_count')
+        return sum(self.load(request).values()) if count is None else count
+
+    def save(self, request, response, lines):
+        request.session['cart'] = encode_lines(lines)
+        request.session['cart_count'] = sum(lines.values())
+
+
+def get_backend():
+    return import_string(getattr(settings, 'CART_BACKEND', 'shop.cart.CookieCartBackend'))()
+
+
+def get_cart(request):
+    """The request's Cart, loaded once"""
+    if not hasattr(request, '_cart'):
+        request._cart = Cart(get_backend().load(request))
+    return request._cart
+
+
+def cart_count(request):
+    """Units in the request's cart, without loading it unless it already is"""
+    cart = getattr(request, '_cart', None)
+    if cart is not None:
+        return cart.count
+    return get_backend().count(request)
+
+
+class CartMiddleware:
+    """Provide request.cart and persist it after the view if it changed"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart = SimpleLazyObject(lambda: get_cart(request))
+        response = self.get_response(request)
+        cart = getattr(request, '_cart', None)
+        if cart is not None and cart.modified:
+            get_backend().save(request, response, cart.lines)
+        return response
+
+
+def hydrate_cart(cart):
+    """
+    Turn a cart ({product_id: quantity}, e.g. a Cart) into line items.
+
+    All products are loaded in a single query, so the cost does not grow
+    with the number of lines. Products that no longer exist are skipped.
+    Returns (cart_items, total).
+    """
+    product_ids = [int(product_id) for product_id in cart]
+    products = Product.objects.select_related('store', 'category').in_bulk(product_ids)
+
+    cart_items = []
+    total = Decimal('0.00')
+    for product_id, quantity in cart.items():
+        product = products.get(int(product_id))
+        if product is None:
+            continue
+        subtotal = product.price * quantity
+        cart_items.append({
+            'product': product,
+            'quantity': quantity,
+            'subtotal': subtotal
+        })
+        total += subtotal
+
+    return cart_items, total
+
+
+def _line_state(product_id, quantity, product=None):
+    return {
+        'product_id': product_id,
+        'quantity': quantity,
+        'name': product.name if product else None,
+        'price': str(product.price) if product else None,
+        'subtotal': str(product.price * quantity) if product else '0.00',
+    }
+
+
+def cart_state(cart, product_ids=None):
+    """
+    JSON-ready summary of a cart: unit count, line count, total, and the
+    lines for `product_ids` (all lines if None). Lines whose product no
+    longer exists are dropped from the cart. One query.
+    """
+    cart_items, total = hydrate_cart(cart)
+    products = {item['product'].id: item['product'] for item in cart_items}
+    for product_id in list(cart):
+        if product_id not in products:
+            cart.remove(product_id)
+
+    if product_ids is None:
+        product_ids = list(cart)
+    return {
+        'count': cart.count,
+        'lines': len(cart),
+        'total': str(total),
+        'items': [
+            _line_state(product_id, cart.quantity(product_id), products.get(product_id))
+            for product_id in product_ids
+        ],
+    }
@@ -0,0 +1,136 @@
+"""
+Order placement for the checkout view.
+
+A cart may hold products from several stores; it becomes one order per
+store. Everything happens inside one transaction, and the number of
+queries depends only on the number of stores, not on the number of lines:
+
+1. load the cart products (shop.cart.hydrate_cart)
+2. decrement stock for every line with a single conditional UPDATE
+3. insert one order per store
+4. bulk insert the order items of all orders
+5. update each store's daily sales rollup (shop.rollups)
+
+The stock UPDATE only matches rows that still have enough stock, so two
+buyers racing for the last unit cannot both succeed: the loser's UPDATE
+touches fewer rows than it has lines and the whole transaction is rolled
+back with OutOfStock.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from . import rollups, versions
+from .cart import hydrate_cart
+from .models import Order, OrderItem, Product
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order"""
+
+
+class EmptyCart(CheckoutError):
+    def __init__(self):
+        super().__init__('Your cart is empty!')
+
+
+class OutOfStock(CheckoutError):
+    def __init__(self, products):
+        self.products = products
+        names = ', '.join(product.name for product in products)
+        super().__init__(f'Not enough stock for {names}!')
+
+
+def decrement_stock(quantities):
+    """
+    Subtract {product_id: quantity} from stock in one UPDATE.
+
+    Returns True only if every product had enough stock; callers must be
+    inside a transaction and roll back otherwise.
+    """
+    enough_stock = reduce(or_, (
+        Q(id=product_id, stock__gte=quantity) for product_id, quantity in quantities.items()
+    ))
+    updated = Product.objects.filter(enough_stock).update(
+        stock=Case(
+            *(When(id=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()),
+            default=F('stock'),
+        ),
+        # Stock is shown on product pages, whose ETags follow updated_at
+        updated_at=timezone.now(),
+    )
+    return updated == len(quantities)
+
+
+def group_by_store(cart_items):
+    """Return (store, items) pairs, in the order stores first appear in the cart"""
+    stores = {}
+    for item in cart_items:
+        store = item['product'].store
+        stores.setdefault(store.id, (store, []))[1].append(item)
+    return stores.values()
+
+
+def place_order(user, cart, shipping_address):
+    """
+    Create one order per store from a cart ({product_id: quantity}), or raise
+    CheckoutError.
+    Returns the list of orders.
+    """
+    try:
+        with transaction.atomic():
+            cart_items, _ = hydrate_cart(cart)
+            if not cart_items:
+                raise EmptyCart()
+
+            # Fail fast on what we already know; the UPDATE below is authoritative
+            short = [item['product'] for item in cart_items if item['product'].stock < item['quantity']]
+            if short:
+                raise OutOfStock(short)
+
+            quantities = {item['product'].id: item['quantity'] for item in cart_items}
+            if not decrement_stock(quantities):
+                raise OutOfStock([])
+
+            orders = []
+            order_items = []
+            for store, items in group_by_store(cart_items):
+                order = Order.objects.create(
+                    user=user,
+                    store=store,
+                    total_amount=sum(item['subtotal'] for item in items),
+                    shipping_address=shipping_address,
+                    status='pending'
+                )
+                orders.append(order)
+                order_items.extend(
+                    OrderItem(
+                        order=order,
+                        product=item['product'],
+                        quantity=item['quantity'],
+                        price=item['product'].price
+                    )
+                    for item in items
+                )
+            OrderItem.objects.bulk_create(order_items)
+
+            for order in orders:
+                # bulk_create skips the OrderItem signals that maintain the rollups
+                rollups.items_sold(order, sum(item.quantity for item in order_items if item.order is order))
+                # Stock levels are shown on cached storefront pages
+                versions.bump_on_commit(order.store_id)
+    except OutOfStock as exc:
+        if exc.products:
+            raise
+        # Someone bought the stock since we loaded it. The partial decrement
+        # has been rolled back, so current stock shows what actually ran out.
+        stock = dict(Product.objects.filter(id__in=quantities).values_list('id', 'stock'))
+        raise OutOfStock([
+            item['product'] for item in cart_items
+            if stock.get(item['product'].id, 0) < item['quantity']
+        ]) from None
+
+    return orders
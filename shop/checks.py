@@ -0,0 +1,24 @@
+"""
+System checks for deployment settings the shop depends on.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Data versions (shop/versions.py) must be shared by every process"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'The default cache ({backend}) is not shared between processes.',
+        hint='Data versions, and so cached pages and sections, go stale in every '
+             'other web or worker process. Set REDIS_URL to use a shared cache.',
+        id='shop.W001',
+    )]
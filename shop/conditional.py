@@ -0,0 +1,93 @@
+"""
+Page state for conditional GETs of product pages.
+
+ConditionalStorefrontMiddleware validates most storefront pages against the
+store's whole catalog version, so any product change anywhere in the store
+sends every page again. Views decorated with @page_state supply a narrower
+state instead: the newest Product.updated_at and Store.updated_at among the
+products the page can show, plus a fingerprint that also covers deleted
+products and category names (which have no timestamp).
+
+catalog_state() computes that with one aggregate per scope (store, or store
+and category) and caches it under the store's catalog version. A catalog
+change recomputes it, but pages whose products didn't change get the same
+validators back and keep answering 304. product_state() combines the states
+of a product page's categories and caches the result the same way, so a
+warm revalidation or page cache hit needs no queries.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from . import versions
+from .models import Category, Product, RelatedProduct, Store
+
+KEY_PREFIX = 'shop:catalog-state'
+
+# Cached in place of the state of a product that doesn't exist
+MISSING = 'missing'
+
+
+def page_state(func):
+    """
+    Mark a view as validated by func(request, *args, **kwargs), which
+    returns (last modified unix time, fingerprint), or None to skip
+    conditional handling (e.g. for a page that will 404)
+    """
+    def decorator(view):
+        view.page_state = func
+        return view
+    return decorator
+
+
+def catalog_state(store_id=None, category_slug=None):
+    """(last modified unix time or None, fingerprint) of a store's or category's products"""
+    key = f'{KEY_PREFIX}:{store_id}:{category_slug or ""}:{versions.get_version(store_id)}'
+    state = cache.get(key)
+    if state is None:
+        products = Product.objects.order_by()
+        stores = Store.objects.order_by()
+        categories = Category.objects.order_by('id')
+        if store_id is not None:
+            products = products.filter(store_id=store_id)
+            stores = stores.filter(pk=store_id)
+            categories = categories.filter(store_id=store_id)
+        if category_slug:
+            products = products.filter(category__slug=category_slug)
+
+        totals = products.aggregate(modified=Max('updated_at'), count=Count('id'))
+        store_modified = stores.aggregate(modified=Max('updated_at'))['modified']
+        modified = max(filter(None, [totals['modified'], store_modified]), default=None)
+        category_names = list(categories.values_list('id', 'slug', 'name'))
+        fingerprint = hashlib.md5(repr((modified, totals['count'], category_names)).encode()).hexdigest()
+        state = (modified.timestamp() if modified else None, fingerprint)
+        cache.set(key, state, getattr(settings, 'CATALOG_STATE_TIMEOUT', 60 * 60))
+    return state
+
+
+def product_state(store_id, slug):
+    """
+    (last modified unix time or None, fingerprint) of a product page: the
+    states of its category and its related products' categories, plus the
+    related ids. None if there is no such available product. Cached under
+    the catalog version of the page's scope (store_id, or the platform).
+    """
+    key = f'{KEY_PREFIX}:product:{store_id}:{slug}:{versions.get_version(store_id)}'
+    state = cache.get(key)
+    if state is None:
+        state = MISSING
+        product = (Product.objects.filter(slug=slug, available=True)
+                   .values_list('id', 'store_id', 'category__slug').first())
+        if product is not None:
+            product_id, product_store_id, category_slug = product
+            links = list(RelatedProduct.objects.filter(product_id=product_id)
+                         .order_by('-score').values_list('related_id', 'related__category__slug'))
+            categories = [catalog_state(product_store_id, category)
+                          for category in sorted({category_slug, *(category for _, category in links)})]
+            modified = max((category[0] for category in categories if category[0]), default=None)
+            fingerprints = [category[1] for category in categories] + [str(related_id) for related_id, _ in links]
+            state = (modified, '.'.join(fingerprints))
+        cache.set(key, state, getattr(settings, 'CATALOG_STATE_TIMEOUT', 60 * 60))
+    return None if state == MISSING else state
@@ -1,5 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart import cart_count
+
+
 def cart_processor(request):
-    """Add cart count to all templates"""
-    cart = request.session.get('cart', {})
-    cart_count = sum(item['quantity'] for item in cart.values())
-    return {'cart_count': cart_count}
+    """Add cart count to all templates, looked up only if a template uses it"""
+    return {'cart_count': SimpleLazyObject(lambda: cart_count(request))}
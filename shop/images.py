@@ -0,0 +1,127 @@
+"""
+Resized derivatives of uploaded images (product photos, store logos).
+
+For every configured width smaller than the original, a WebP and a JPEG copy
+is stored next to it, named from the original so no lookup table is needed:
+
+    products/shoe.png -> products/shoe.w320.webp, products/shoe.w320.jpg
+
+Derivatives are made by a background task (shop.taskqueue) queued when an
+image is saved. Which widths exist is kept in the (shared) cache, so
+rendering a srcset doesn't touch storage or the database: the worker records
+them when it is done, and a page that finds none records that too, for
+IMAGE_MANIFEST_MISS_TIMEOUT seconds, before looking again (and queueing
+the task, for images saved before derivatives existed). `manage.py gc_media`
+forgets both when it deletes an image, so the same bytes uploaded again get
+their derivatives rebuilt.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Task
+from .taskqueue import task
+
+KEY_PREFIX = 'shop:images'
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+
+def derivative_widths():
+    return getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', [160, 320, 640, 1024])
+
+
+def derivative_name(name, width, extension):
+    root, _ = posixpath.splitext(name)
+    return f'{root}.w{width}.{extension}'
+
+
+def _manifest_key(name):
+    return f'{KEY_PREFIX}:{hashlib.md5(name.encode()).hexdigest()}'
+
+
+def _task_key(name):
+    return f'images:{name}'[:200]
+
+
+def stored_widths(name):
+    """Widths with derivatives in storage for the image stored as `name`"""
+    return [width for width in derivative_widths()
+            if default_storage.exists(derivative_name(name, width, 'jpg'))]
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten onto white
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80), optimize=True)
+    return buffer.getvalue()
+
+
+@task
+def generate_derivatives(name):
+    """Write the derivatives of one stored image; returns the widths made"""
+    with default_storage.open(name, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.getbands() else 'RGB')
+
+    widths = [width for width in derivative_widths() if width < image.width]
+    for width in widths:
+        resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        for extension, (image_format, content_type) in FORMATS.items():
+            target = derivative_name(name, width, extension)
+            if default_storage.exists(target):
+                default_storage.delete(target)
+            default_storage.save(target, ContentFile(_encode(resized, image_format)))
+
+    cache.set(_manifest_key(name), widths, None)
+    return widths
+
+
+def queue_derivatives(image):
+    """Queue derivative generation for a FieldFile, once per stored name"""
+    if image and image.name:
+        generate_derivatives.enqueue(args=[image.name], key=_task_key(image.name), priority=-1)
+
+
+def forget_derivatives(name):
+    """Drop the recorded widths and finished task of a deleted image"""
+    cache.delete(_manifest_key(name))
+    Task.objects.filter(key=_task_key(name)).exclude(status='running').delete()
+
+
+def ready_widths(image):
+    """
+    Derivative widths of a FieldFile, smallest first. [] if it has none yet
+    or the original is smaller than every width.
+    """
+    key = _manifest_key(image.name)
+    widths = cache.get(key)
+    if widths is None:
+        widths = stored_widths(image.name)
+        # Found derivatives don't change; a miss is looked at again later
+        cache.set(key, widths, None if widths else getattr(settings, 'IMAGE_MANIFEST_MISS_TIMEOUT', 60 * 60))
+        if not widths:
+            queue_derivatives(image)
+    return widths
+
+
+def derivative_url(name, width, extension):
+    return default_storage.url(derivative_name(name, width, extension))
+
+
+def srcset(name, widths, extension):
+    return ', '.join(f'{derivative_url(name, width, extension)} {width}w' for width in widths)
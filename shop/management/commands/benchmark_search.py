@@ -0,0 +1,37 @@
+"""
+Management command to compare the full-text search backend with the
+old icontains scan on the current catalog
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.models import Store
+from shop.search import SimpleSearchBackend, get_backend
+
+
+class Command(BaseCommand):
+    help = 'Time product search: configured backend vs icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='+', help='Search phrases to time')
+        parser.add_argument('--store', help='Store slug to scope the search to')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query (default 20)')
+        parser.add_argument('--limit', type=int, default=24, help='Results per query (default 24)')
+
+    def handle(self, *args, **options):
+        store = None
+        if options['store']:
+            try:
+                store = Store.objects.get(slug=options['store'])
+            except Store.DoesNotExist:
+                raise CommandError(f'Store "{options["store"]}" does not exist')
+
+        backends = [('icontains', SimpleSearchBackend()), (type(get_backend()).__name__, get_backend())]
+        for query in options['queries']:
+            self.stdout.write(f'"{query}"')
+            for label, backend in backends:
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    ids = backend.search(query, store=store, limit=options['limit'])
+                elapsed = (time.perf_counter() - start) / options['repeat'] * 1000
+                self.stdout.write(f'  {label:<22} {elapsed:8.2f} ms/query  ({len(ids)} results)')
@@ -0,0 +1,66 @@
+"""
+Management command to delete content-addressed media blobs (and their
+resized derivatives) that no file field references any more, along with
+the derivatives' cached manifest and task (see shop.images)
+"""
+import posixpath
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+from shop.images import forget_derivatives
+from shop.storage import BLOB_DIR, blob_digest
+
+
+def referenced_digests():
+    """Digests of every blob some FileField/ImageField points at"""
+    digests = set()
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField):
+                names = model._default_manager.exclude(**{field.name: ''}).exclude(**{f'{field.name}__isnull': True})
+                for name in names.values_list(field.name, flat=True).iterator():
+                    digest = blob_digest(name)
+                    if digest:
+                        digests.add(digest)
+    return digests
+
+
+def stored_blobs():
+    """Yield every file name under the blob directory"""
+    shards, _ = default_storage.listdir(BLOB_DIR) if default_storage.exists(BLOB_DIR) else ([], [])
+    for shard in shards:
+        for filename in default_storage.listdir(posixpath.join(BLOB_DIR, shard))[1]:
+            yield posixpath.join(BLOB_DIR, shard, filename)
+
+
+class Command(BaseCommand):
+    help = 'Delete media blobs that no record references'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Only delete blobs older than this many hours (uploads in flight are kept)')
+        parser.add_argument('--dry-run', action='store_true', help='List what would be deleted')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=options['min_age'])
+        referenced = referenced_digests()
+        deleted = freed = 0
+        for name in stored_blobs():
+            if blob_digest(name) in referenced or default_storage.get_modified_time(name) > cutoff:
+                continue
+            size = default_storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(f'would delete {name} ({size} bytes)')
+            else:
+                default_storage.delete(name)
+                forget_derivatives(name)
+            deleted += 1
+            freed += size
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] {verb} {deleted} unreferenced blobs ({freed} bytes); {len(referenced)} blobs in use'
+        ))
@@ -0,0 +1,38 @@
+"""
+Management command to recompute the related products shown on product
+pages from order history and categories (run it nightly, or with --queue
+to hand it to the task worker)
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.models import Store
+from shop.related import rebuild_related, rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = 'Recompute related products from orders and categories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', help='Only this store (slug)')
+        parser.add_argument('--queue', action='store_true', help='Enqueue as a background task instead')
+
+    def handle(self, *args, **options):
+        stores = Store.objects.filter(is_active=True)
+        if options['store']:
+            try:
+                stores = [Store.objects.get(slug=options['store'])]
+            except Store.DoesNotExist:
+                raise CommandError(f'Store "{options["store"]}" does not exist')
+
+        if options['queue']:
+            for store in stores:
+                rebuild_related_products.enqueue(args=[store.pk])
+            self.stdout.write(self.style.SUCCESS(f'[OK] Queued {len(stores)} rebuilds'))
+            return
+
+        for store in stores:
+            started = time.monotonic()
+            links = rebuild_related(store.pk)
+            self.stdout.write(f'{store.slug}: {links} related links in {time.monotonic() - started:.2f}s')
+        self.stdout.write(self.style.SUCCESS('[OK] Related products rebuilt'))
@@ -0,0 +1,19 @@
+"""
+Management command to rebuild the product full-text search index,
+e.g. after bulk updates that bypassed the Product signals
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from shop.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        with transaction.atomic():
+            count = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Indexed {count} products with {type(backend).__name__}'
+        ))
@@ -0,0 +1,57 @@
+"""
+Management command to backfill or reconcile the StoreDailyStats rollups
+from raw orders
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from shop.models import Order, Store, StoreDailyStats
+from shop.rollups import COUNTERS, compute_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-store daily sales rollups from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--store', help='Only this store (slug)')
+        parser.add_argument('--check', action='store_true',
+                            help='Report rows that differ from the orders without changing anything')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all()
+        rows = StoreDailyStats.objects.all()
+        if options['store']:
+            try:
+                store = Store.objects.get(slug=options['store'])
+            except Store.DoesNotExist:
+                raise CommandError(f'Store "{options["store"]}" does not exist')
+            orders = orders.filter(store=store)
+            rows = rows.filter(store=store)
+
+        expected = compute_daily_stats(orders)
+
+        if options['check']:
+            current = {
+                (row['store_id'], row['date']): {counter: row[counter] for counter in COUNTERS}
+                for row in rows.values('store_id', 'date', *COUNTERS)
+            }
+            mismatches = 0
+            for key in sorted(set(expected) | set(current), key=str):
+                want = expected.get(key, dict.fromkeys(COUNTERS, 0))
+                have = current.get(key, dict.fromkeys(COUNTERS, 0))
+                if want != have:
+                    mismatches += 1
+                    self.stdout.write(self.style.WARNING(f'store {key[0]} on {key[1]}: have {have}, expected {want}'))
+            if mismatches:
+                self.stdout.write(self.style.ERROR(f'{mismatches} rollup rows out of date'))
+            else:
+                self.stdout.write(self.style.SUCCESS('[OK] Rollups match orders'))
+            return
+
+        with transaction.atomic():
+            rows.delete()
+            StoreDailyStats.objects.bulk_create(
+                [StoreDailyStats(store_id=store_id, date=date, **counters)
+                 for (store_id, date), counters in expected.items()],
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(f'[OK] Rebuilt {len(expected)} daily rollup rows'))
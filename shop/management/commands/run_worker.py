@@ -0,0 +1,32 @@
+"""
+Management command to run background tasks from the database queue
+(see shop.taskqueue). Run several for more throughput; each claims its
+own tasks.
+"""
+import signal
+
+from django.core.management.base import BaseCommand
+from shop.taskqueue import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help='Tasks run in parallel (threads)')
+        parser.add_argument('--poll-interval', type=float, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--task', action='append', dest='names', help='Only run tasks with this name')
+        parser.add_argument('--burst', action='store_true', help='Exit once no tasks are due')
+
+    def handle(self, *args, **options):
+        worker = Worker(options['concurrency'], options['poll_interval'], options['names'])
+
+        def stop(signum, frame):
+            # Finish the running tasks, then exit
+            worker.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f'Worker started with {worker.concurrency} threads')
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS('[OK] Worker stopped'))
@@ -1,50 +1,161 @@
+import hashlib
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
-from .models import Store
+from . import store_cache, versions
 
 
-class StoreMiddleware(MiddlewareMixin):
+DEFAULT_EXEMPT_PATHS = ['/static/', '/media/', '/admin/', '/accounts/', '/dashboard/']
+DEFAULT_BLOCKED_PATHS = ['/admin/', '/dashboard/', '/my-stores/', '/create-store/']
+
+
+def resolve_store(request):
     """
-    Middleware to detect and set the current store based on:
+    Return (store, is_custom_domain) for the request, computed once.
     1. Custom domain (if configured)
     2. URL slug pattern (/store/<slug>/)
-    
-    ALSO blocks admin/dashboard access on custom domains for security
     """
-    
-    def process_request(self, request):
-        store = None
+    if not hasattr(request, '_cached_store'):
         host = request.get_host().split(':')[0]  # Remove port if present
-        
+
         # Try to match custom domain first
-        is_custom_domain = False
-        try:
-            store = Store.objects.get(domain=host, is_active=True)
-            is_custom_domain = True
-        except Store.DoesNotExist:
+        store = store_cache.get_store_by_domain(host)
+        is_custom_domain = store is not None
+        if store is None:
             # Check if URL contains store slug pattern
             path_parts = request.path.strip('/').split('/')
             if len(path_parts) >= 2 and path_parts[0] == 'store':
-                store_slug = path_parts[1]
-                try:
-                    store = Store.objects.get(slug=store_slug, is_active=True)
-                except Store.DoesNotExist:
-                    pass
-        
+                store = store_cache.get_store_by_slug(path_parts[1])
+
+        request._cached_store = (store, is_custom_domain)
+    return request._cached_store
+
+
+class StoreMiddleware(MiddlewareMixin):
+    """
+    Middleware to detect and set the current store based on:
+    1. Custom domain (if configured)
+    2. URL slug pattern (/store/<slug>/)
+
+    request.store and request.is_custom_domain are lazy, like request.user,
+    so nothing is looked up until a view or template reads them. Paths in
+    STORE_MIDDLEWARE_EXEMPT_PATHS never resolve a store at all.
+
+    Lookups are served from shop.store_cache, so steady-state routing
+    does not touch the database.
+
+    ALSO blocks admin/dashboard access on custom domains for security
+    """
+
+    def process_request(self, request):
+        path = request.path
+
         # Security: Block admin/dashboard access on custom domains
-        if is_custom_domain:
-            # Block admin, dashboard, and other management URLs
-            blocked_paths = ['/admin/', '/dashboard/', '/my-stores/', '/create-store/']
-            for blocked in blocked_paths:
-                if request.path.startswith(blocked):
-                    return HttpResponseForbidden(
-                        "<h1>Access Denied</h1>"
-                        "<p>Admin access is not available on this domain.</p>"
-                        "<p>Please use the main platform to access your dashboard.</p>"
-                    )
-        
+        blocked_paths = getattr(settings, 'STORE_MIDDLEWARE_BLOCKED_PATHS', DEFAULT_BLOCKED_PATHS)
+        if path.startswith(tuple(blocked_paths)):
+            host = request.get_host().split(':')[0]
+            if store_cache.get_store_by_domain(host) is not None:
+                return HttpResponseForbidden(
+                    "<h1>Access Denied</h1>"
+                    "<p>Admin access is not available on this domain.</p>"
+                    "<p>Please use the main platform to access your dashboard.</p>"
+                )
+
+        # Paths that never need tenant context skip resolution entirely
+        exempt_paths = getattr(settings, 'STORE_MIDDLEWARE_EXEMPT_PATHS', DEFAULT_EXEMPT_PATHS)
+        if path.startswith(tuple(exempt_paths)):
+            request.store = None
+            request.is_custom_domain = False
+            return None
+
         # Attach store to request
-        request.store = store
-        request.is_custom_domain = is_custom_domain
+        request.store = SimpleLazyObject(lambda: resolve_store(request)[0])
+        request.is_custom_domain = SimpleLazyObject(lambda: resolve_store(request)[1])
         return None
+
+
+# Storefront pages show the catalog and the theme
+STOREFRONT_ENTITIES = [versions.CATALOG, versions.THEME]
+
+
+def _visitor_cookies(request):
+    """Cookies that change what an anonymous visitor's page shows"""
+    names = [getattr(settings, 'CART_COOKIE_NAME', 'cart'), settings.CSRF_COOKIE_NAME]
+    return [request.COOKIES.get(name, '') for name in names]
+
+
+def storefront_etag(request, *state):
+    """Weak ETag of a storefront page from its data state, the URL and the visitor's cookies"""
+    parts = [request.get_host(), request.get_full_path(), *map(str, state), *_visitor_cookies(request)]
+    return f'W/"{hashlib.md5(chr(0).join(parts).encode()).hexdigest()}"'
+
+
+def _page_validators(request, view_func, view_args, view_kwargs):
+    """(etag, last modified unix time or None), or None to skip"""
+    store = getattr(request, 'store', None) or None  # unwrap a lazy None
+    store_id = store.pk if store else None
+    page_state = getattr(view_func, 'page_state', None)
+    if page_state is None:
+        state = versions.get_versions(store_id, STOREFRONT_ENTITIES).values()
+        modified = versions.last_modified(store_id, STOREFRONT_ENTITIES)
+    else:
+        # The view's own state (shop.conditional), plus the theme
+        view_state = page_state(request, *view_args, **view_kwargs)
+        if view_state is None:
+            return None
+        state = [view_state[1], versions.get_version(store_id, versions.THEME)]
+        theme_modified = versions.last_modified(store_id, [versions.THEME])
+        modified = max(view_state[0], theme_modified) if view_state[0] and theme_modified else None
+    if any(_visitor_cookies(request)):
+        modified = None
+    return storefront_etag(request, *state), modified
+
+
+class ConditionalStorefrontMiddleware(MiddlewareMixin):
+    """
+    ETag and Last-Modified for anonymous storefront GETs, computed before
+    the view runs, so a visitor or CDN revalidating an unchanged page gets a
+    304 without it being rendered. They come from the store's data versions
+    (shop.versions), or from the view's @page_state (shop.conditional).
+
+    Only applies to visitors without a session (logged-in users, session
+    messages) and outside STORE_MIDDLEWARE_EXEMPT_PATHS. Last-Modified is
+    only used for visitors with no cart or CSRF cookie, since their page can
+    change without the store changing.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        exempt_paths = getattr(settings, 'STORE_MIDDLEWARE_EXEMPT_PATHS', DEFAULT_EXEMPT_PATHS)
+        if request.path.startswith(tuple(exempt_paths)):
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or 'messages' in request.COOKIES:
+            return None
+
+        validators = _page_validators(request, view_func, view_args, view_kwargs)
+        if validators is None:
+            return None
+        request._storefront_validators = etag, modified = validators
+        return get_conditional_response(request, etag=etag, last_modified=modified and int(modified))
+
+    def process_response(self, request, response):
+        validators = getattr(request, '_storefront_validators', None)
+        if validators is None or response.status_code not in (200, 304):
+            return response
+        # Responses that set cookies (e.g. a new CSRF token) must be fetched
+        # in full each time; an ETag set by the view is kept
+        if response.cookies or response.streaming or response.has_header('ETag'):
+            return response
+        etag, modified = validators
+        response['ETag'] = etag
+        if modified:
+            response['Last-Modified'] = http_date(modified)
+        patch_cache_control(response, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_storetheme'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', '-created_at', '-id'], name='product_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'available', '-created_at', '-id'], name='product_store_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'category', 'available'], name='product_store_category_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5("
+    "name, description, store_id UNINDEXED, category_id UNINDEXED, available UNINDEXED, "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO shop_product_fts(rowid, name, description, store_id, category_id, available) "
+    "SELECT id, name, description, store_id, category_id, available FROM shop_product",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS shop_product_fts"]
+
+POSTGRES_CREATE = [
+    "CREATE INDEX IF NOT EXISTS shop_product_search_idx ON shop_product USING GIN "
+    "(to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '')))",
+]
+POSTGRES_DROP = ["DROP INDEX IF EXISTS shop_product_search_idx"]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRES_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('items_sold', models.IntegerField(default=0)),
+                ('pending', models.IntegerField(default=0)),
+                ('processing', models.IntegerField(default=0)),
+                ('shipped', models.IntegerField(default=0)),
+                ('delivered', models.IntegerField(default=0)),
+                ('cancelled', models.IntegerField(default=0)),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='shop.store')),
+            ],
+            options={
+                'verbose_name': 'Store Daily Stats',
+                'verbose_name_plural': 'Store Daily Stats',
+                'ordering': ['-date'],
+                'unique_together': {('store', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_storedailystats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', '-created_at', '-id'], name='order_store_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'status', '-created_at', '-id'], name='order_store_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['store', 'total_amount', 'id'], name='order_store_total_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', '-created_at', '-id'], name='product_store_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'name', 'id'], name='product_store_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'price', 'id'], name='product_store_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['store', 'stock', 'id'], name='product_store_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storetheme',
+            name='section_plan',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='storetheme',
+            name='stylesheet',
+            field=models.FileField(blank=True, editable=False, upload_to='themes/'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+from shop.rollups import compute_daily_stats
+
+
+def backfill(apps, schema_editor):
+    """Fill StoreDailyStats from existing orders (same as `manage.py rebuild_store_stats`)"""
+    StoreDailyStats = apps.get_model('shop', 'StoreDailyStats')
+    if StoreDailyStats.objects.exists():
+        return
+    Order = apps.get_model('shop', 'Order')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    expected = compute_daily_stats(Order.objects.all(), OrderItem.objects.all())
+    StoreDailyStats.objects.bulk_create(
+        [StoreDailyStats(store_id=store_id, date=date, **counters)
+         for (store_id, date), counters in expected.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from shop.themes import ThemeError, compile_theme
+
+
+def compile_themes(apps, schema_editor):
+    """Build the stylesheet and section plan of themes saved before they existed"""
+    StoreTheme = apps.get_model('shop', 'StoreTheme')
+    for theme in StoreTheme.objects.select_related('store').iterator():
+        try:
+            compile_theme(theme)
+        except ThemeError:
+            # Left for the merchant to fix in the editor
+            continue
+        theme.save(update_fields=['stylesheet', 'section_plan'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_backfill_storedailystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(compile_themes, migrations.RunPython.noop),
+    ]
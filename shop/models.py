@@ -1,8 +1,12 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 
+from .themes import ThemeError, default_sections, section_plan
+
 
 class Store(models.Model):
     """Multi-tenant store model - each user can create multiple stores"""
@@ -67,6 +71,17 @@ class Product(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = [['slug', 'store']]  # Unique slug per store
+        indexes = [
+            # Storefront listings, keyset-paginated on (created_at, id)
+            models.Index(fields=['available', '-created_at', '-id'], name='product_listing_idx'),
+            models.Index(fields=['store', 'available', '-created_at', '-id'], name='product_store_listing_idx'),
+            models.Index(fields=['store', 'category', 'available'], name='product_store_category_idx'),
+            # Dashboard product table sorts (dashboard.tables.PRODUCT_SORTS)
+            models.Index(fields=['store', '-created_at', '-id'], name='product_store_newest_idx'),
+            models.Index(fields=['store', 'name', 'id'], name='product_store_name_idx'),
+            models.Index(fields=['store', 'price', 'id'], name='product_store_price_idx'),
+            models.Index(fields=['store', 'stock', 'id'], name='product_store_stock_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.store.name})"
@@ -80,6 +95,14 @@ class Product(models.Model):
         return reverse('store_product_detail', args=[self.store.slug, self.slug])
 
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Load user, store and items (with their products) in two queries"""
+        return self.select_related('user', 'store').prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('product'))
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -97,8 +120,16 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     shipping_address = models.TextField()
     
+    objects = OrderQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Dashboard order table, with and without a status filter
+            models.Index(fields=['store', '-created_at', '-id'], name='order_store_newest_idx'),
+            models.Index(fields=['store', 'status', '-created_at', '-id'], name='order_store_status_idx'),
+            models.Index(fields=['store', 'total_amount', 'id'], name='order_store_total_idx'),
+        ]
 
     def __str__(self):
         return f'Order {self.id} - {self.user.username} ({self.store.name})'
@@ -117,6 +148,84 @@ class OrderItem(models.Model):
         return self.quantity * self.price
 
 
+class StoreDailyStats(models.Model):
+    """Per-store, per-day sales rollup, maintained incrementally (see shop.rollups)"""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    items_sold = models.IntegerField(default=0)
+
+    # Orders placed that day, by their current status
+    pending = models.IntegerField(default=0)
+    processing = models.IntegerField(default=0)
+    shipped = models.IntegerField(default=0)
+    delivered = models.IntegerField(default=0)
+    cancelled = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Store Daily Stats'
+        verbose_name_plural = 'Store Daily Stats'
+        ordering = ['-date']
+        unique_together = [['store', 'date']]
+
+    def __str__(self):
+        return f"{self.store.name} - {self.date}"
+
+
+class RelatedProduct(models.Model):
+    """A product's precomputed related product and its score (see shop.related)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = [['product', 'related']]
+        indexes = [
+            # A product page's top-K neighbours
+            models.Index(fields=['product', '-score'], name='related_product_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class Task(models.Model):
+    """A unit of background work, run by `manage.py run_worker` (see shop.taskqueue)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200, help_text="Dotted path of a @task function")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True,
+                           help_text="Idempotency key: a key is only ever enqueued once")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-priority', 'run_at', 'id']
+        indexes = [
+            # Workers pick the next due task in this order
+            models.Index(fields=['status', '-priority', 'run_at', 'id'], name='task_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
 class StoreTheme(models.Model):
     """Store theme customization for visual editor"""
     store = models.OneToOneField(Store, on_delete=models.CASCADE, related_name='theme')
@@ -140,6 +249,10 @@ class StoreTheme(models.Model):
     layout_width = models.CharField(max_length=20, default='container', 
                                    choices=[('container', 'Boxed'), ('fluid', 'Full Width')])
     
+    # Compiled from the fields above on save (see shop/themes.py)
+    stylesheet = models.FileField(upload_to='themes/', blank=True, editable=False)
+    section_plan = models.JSONField(default=list, blank=True, editable=False)
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -151,38 +264,12 @@ class StoreTheme(models.Model):
     def __str__(self):
         return f"Theme for {self.store.name}"
     
+    def clean(self):
+        try:
+            section_plan(self.sections or self.get_default_sections())
+        except ThemeError as e:
+            raise ValidationError({'sections': str(e)})
+    
     def get_default_sections(self):
         """Returns default sections structure"""
-        return {
-            'sections': [
-                {
-                    'id': 'hero',
-                    'type': 'hero_banner',
-                    'enabled': True,
-                    'settings': {
-                        'title': f'Welcome to {self.store.name}',
-                        'subtitle': 'Discover amazing products',
-                        'button_text': 'Shop Now',
-                        'background_image': '',
-                    }
-                },
-                {
-                    'id': 'featured_products',
-                    'type': 'product_grid',
-                    'enabled': True,
-                    'settings': {
-                        'title': 'Featured Products',
-                        'products_count': 8,
-                    }
-                },
-                {
-                    'id': 'footer',
-                    'type': 'footer',
-                    'enabled': True,
-                    'settings': {
-                        'text': f'© 2024 {self.store.name}. All rights reserved.',
-                        'social_links': []
-                    }
-                }
-            ]
-        }
+        return default_sections(self.store.name)
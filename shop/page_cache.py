@@ -0,0 +1,102 @@
+"""
+Whole-page caching for anonymous storefront traffic.
+
+Pages are cached per store and per catalog and theme version (see
+shop.versions), so a change to a store's products, categories, details or
+theme makes its cached pages unreachable at once. The key also covers the
+path and query string.
+
+Per-visitor bits (cart badge, flash messages) are "holes": while a page is
+rendered for the cache, {% dynamic %} writes a marker instead of the
+snippet, and every response, fresh or cached, gets its markers replaced by
+the snippet rendered for the current request.
+"""
+import hashlib
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from . import versions
+
+KEY_PREFIX = 'shop:page'
+HOLE_RE = re.compile(r'<!--dynamic:([\w./-]+)-->')
+
+
+def hole_marker(template_name):
+    return f'<!--dynamic:{template_name}-->'
+
+
+def is_rendering_for_cache(request):
+    return getattr(request, '_page_cache_holes', False)
+
+
+def fill_holes(html, request):
+    """Replace hole markers with snippets rendered for this request"""
+    rendered = {}
+
+    def render_hole(match):
+        template_name = match.group(1)
+        if template_name not in rendered:
+            rendered[template_name] = render_to_string(template_name, request=request)
+        return rendered[template_name]
+
+    return HOLE_RE.sub(render_hole, html)
+
+
+def page_cache_key(request, store_id):
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    path = hashlib.md5(request.path.encode()).hexdigest()
+    version = f'{versions.get_version(store_id)}.{versions.get_version(store_id, versions.THEME)}'
+    return f'{KEY_PREFIX}:{store_id or versions.GLOBAL}:{version}:{path}:{query}'
+
+
+def _cacheable_request(request):
+    return request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+def _cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.cookies
+        # A CSRF token in the page would be shared between visitors
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def cache_storefront_page(view):
+    """
+    Cache a storefront view's HTML for anonymous visitors.
+
+    The page is scoped to request.store when there is one (custom domain or
+    /store/<slug>/), otherwise to the whole platform catalog.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not _cacheable_request(request):
+            return view(request, *args, **kwargs)
+
+        store = getattr(request, 'store', None)
+        key = page_cache_key(request, store.pk if store else None)
+        html = cache.get(key)
+        if html is not None:
+            return HttpResponse(fill_holes(html, request))
+
+        request._page_cache_holes = True
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            request._page_cache_holes = False
+        if response.streaming or not getattr(response, 'is_rendered', True):
+            return response
+
+        html = response.content.decode(response.charset)
+        if _cacheable_response(request, response):
+            cache.set(key, html, getattr(settings, 'STOREFRONT_CACHE_TIMEOUT', 600))
+        response.content = fill_holes(html, request)
+        return response
+
+    return wrapper
@@ -0,0 +1,90 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page remembers the sort key of its last row and the
+next page asks for rows strictly after it. With an index on the sort columns
+every page costs the same, however deep into the listing it is.
+
+The sort fields must be plain (non-relation) columns and end in a unique one
+(normally id) so the cursor identifies exactly one position.
+"""
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    data = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def _after(ordering, values):
+    """Q matching rows that sort after `values` in `ordering`"""
+    conditions = []
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {f.lstrip('-'): value for f, value in zip(ordering[:i], values)}
+        conditions.append(Q(**equal, **{f'{name}__{lookup}': values[i]}))
+    return reduce(or_, conditions)
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def paginate_keyset(queryset, cursor=None, per_page=24, ordering=('-created_at', '-id')):
+    """
+    Return one KeysetPage of `queryset` sorted by `ordering`, starting after
+    `cursor` (as produced by a previous page). An unreadable cursor raises
+    InvalidCursor.
+    """
+    ordering = list(ordering)
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise InvalidCursor(cursor)
+        try:
+            queryset = queryset.filter(_after(ordering, values))
+        except (ValidationError, ValueError):
+            raise InvalidCursor(cursor)
+
+    # Fetch one extra row to know whether there is a next page
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return KeysetPage(rows, next_cursor)
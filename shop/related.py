@@ -0,0 +1,125 @@
+"""
+Precomputed related products ("frequently bought together").
+
+rebuild_related(store_id) reads the store's order items once, ordered by
+order, and counts how often each pair of products was bought together.
+Pairs are scored by cosine similarity,
+
+    together(a, b) / sqrt(orders(a) * orders(b))
+
+so best-sellers don't become everyone's neighbour, plus CATEGORY_WEIGHT when
+both are in the same category. Each available product keeps its top
+RELATED_PRODUCTS_PER_PRODUCT neighbours; products with fewer (new or rarely
+bought ones) are topped up with the newest products of their category. The
+results replace the store's RelatedProduct rows in one transaction, so
+product_detail reads them with one indexed query.
+
+Counting uses sparse Counters over the pairs that actually occur, so the
+cost grows with the sum of squared basket sizes, not products squared.
+Baskets over MAX_BASKET_SIZE products are skipped: bulk orders say little
+about what goes together and cost the most to count.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+
+from . import versions
+from .models import OrderItem, Product, RelatedProduct, Store
+from .taskqueue import task
+
+CATEGORY_WEIGHT = 0.1
+MAX_BASKET_SIZE = 50
+
+
+def related_per_product():
+    return getattr(settings, 'RELATED_PRODUCTS_PER_PRODUCT', 8)
+
+
+def baskets(store_id):
+    """Yield the set of product ids of each of a store's orders"""
+    rows = (OrderItem.objects.filter(order__store_id=store_id)
+            .order_by('order_id').values_list('order_id', 'product_id')
+            .iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)))
+    for _, items in groupby(rows, key=itemgetter(0)):
+        yield {product_id for _, product_id in items}
+
+
+def co_occurrence(baskets):
+    """(orders per product, orders per product pair) as Counters; pairs are (low id, high id)"""
+    counts, pairs = Counter(), Counter()
+    for basket in baskets:
+        if len(basket) > MAX_BASKET_SIZE:
+            continue
+        counts.update(basket)
+        pairs.update(combinations(sorted(basket), 2))
+    return counts, pairs
+
+
+def neighbour_scores(categories, counts, pairs):
+    """{product id: {neighbour id: score}} for the products in `categories` ({id: category id})"""
+    scores = defaultdict(dict)
+    for (first, second), together in pairs.items():
+        if first not in categories or second not in categories:
+            continue
+        score = together / math.sqrt(counts[first] * counts[second])
+        if categories[first] == categories[second]:
+            score += CATEGORY_WEIGHT
+        scores[first][second] = scores[second][first] = score
+    return scores
+
+
+def top_related(product_id, scores, category_members, limit):
+    """[(neighbour id, score)], best first, topped up from the category's newest products"""
+    best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+    chosen = {neighbour for neighbour, _ in best} | {product_id}
+    for member in category_members:
+        if len(best) >= limit:
+            break
+        if member not in chosen:
+            best.append((member, 0.0))
+            chosen.add(member)
+    return best
+
+
+def rebuild_related(store_id, limit=None):
+    """Recompute a store's RelatedProduct rows; returns how many were written"""
+    limit = limit or related_per_product()
+    products = (Product.objects.filter(store_id=store_id, available=True)
+                .order_by('-created_at', '-id').values_list('id', 'category_id'))
+    categories = {}
+    members = defaultdict(list)
+    for product_id, category_id in products:
+        categories[product_id] = category_id
+        members[category_id].append(product_id)
+
+    scores = neighbour_scores(categories, *co_occurrence(baskets(store_id)))
+    links = [
+        RelatedProduct(product_id=product_id, related_id=related_id, score=score)
+        for product_id, category_id in categories.items()
+        for related_id, score in top_related(product_id, scores.get(product_id, {}), members[category_id], limit)
+    ]
+    with transaction.atomic():
+        RelatedProduct.objects.filter(product__store_id=store_id).delete()
+        RelatedProduct.objects.bulk_create(links, batch_size=1000)
+    # Product pages show the new neighbours
+    versions.bump_on_commit(store_id)
+    return len(links)
+
+
+@task
+def rebuild_related_products(store_id=None):
+    """Rebuild related products for one store, or every active store"""
+    store_ids = [store_id] if store_id else Store.objects.filter(is_active=True).values_list('id', flat=True)
+    return {str(pk): rebuild_related(pk) for pk in store_ids}
+
+
+def related_products(product, limit=4):
+    """A product's precomputed related products, best first"""
+    links = (RelatedProduct.objects.filter(product=product, related__available=True)
+             .select_related('related__category').order_by('-score')[:limit])
+    return [link.related for link in links]
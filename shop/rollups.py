@@ -0,0 +1,123 @@
+"""
+Incremental maintenance of StoreDailyStats.
+
+Each order counts towards the row for its store and the (local) date it was
+placed. Signals in shop.signals call these helpers when orders and order
+items are created, change status or are deleted; every change is a single
+UPDATE with F() expressions, so concurrent checkouts don't lose counts.
+
+`manage.py rebuild_store_stats` recomputes the rows from raw orders, for the
+initial backfill and to reconcile after bulk edits that skip signals.
+
+While a store is being deleted its rows go with it, so the orders deleted in
+the same cascade leave the rollups alone (see store_deleting).
+"""
+import threading
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, StoreDailyStats
+
+STATUSES = [status for status, label in Order.STATUS_CHOICES]
+COUNTERS = ['orders', 'revenue', 'items_sold'] + STATUSES
+
+
+_local = threading.local()
+
+
+def _deleting_stores():
+    if not hasattr(_local, 'stores'):
+        _local.stores = set()
+    return _local.stores
+
+
+def store_deleting(store_id):
+    """Stop maintaining a store's rollups while it is deleted"""
+    _deleting_stores().add(store_id)
+
+
+def store_deleted(store_id):
+    _deleting_stores().discard(store_id)
+
+
+def stats_date(order):
+    return timezone.localdate(order.created_at)
+
+
+def apply(store_id, date, **deltas):
+    """Add `deltas` to the counters of one day, creating the row if needed"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas or store_id in _deleting_stores():
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if StoreDailyStats.objects.filter(store_id=store_id, date=date).update(**updates):
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        # Nothing to take away from; rebuild_store_stats reconciles
+        return
+    try:
+        with transaction.atomic():
+            StoreDailyStats.objects.create(store_id=store_id, date=date, **deltas)
+    except IntegrityError:
+        # Another request created the row first
+        StoreDailyStats.objects.filter(store_id=store_id, date=date).update(**updates)
+
+
+def order_created(order):
+    apply(order.store_id, stats_date(order), orders=1, revenue=order.total_amount, **{order.status: 1})
+
+
+def order_changed(order, previous_status, previous_total):
+    deltas = {'revenue': order.total_amount - previous_total}
+    if order.status != previous_status:
+        deltas[previous_status] = -1
+        deltas[order.status] = 1
+    apply(order.store_id, stats_date(order), **deltas)
+
+
+def order_deleted(order):
+    apply(order.store_id, stats_date(order), orders=-1, revenue=-order.total_amount, **{order.status: -1})
+
+
+def items_sold(order, quantity):
+    apply(order.store_id, stats_date(order), items_sold=quantity)
+
+
+def compute_daily_stats(orders=None, items=None):
+    """
+    Recompute rollups from raw orders (and `items`, the OrderItem
+    queryset to use, for migrations' historical models).
+    Returns {(store_id, date): {counter: value}}.
+    """
+    if orders is None:
+        orders = Order.objects.all()
+    if items is None:
+        items = OrderItem.objects.all()
+    stats = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    order_rows = (
+        orders.annotate(date=TruncDate('created_at')).order_by()
+        .values('store_id', 'date')
+        .annotate(
+            orders=Count('id'),
+            revenue=Sum('total_amount'),
+            **{status: Count('id', filter=Q(status=status)) for status in STATUSES}
+        )
+    )
+    for row in order_rows:
+        stats[row.pop('store_id'), row.pop('date')].update(row)
+
+    item_rows = (
+        items.filter(order__in=orders)
+        .annotate(date=TruncDate('order__created_at')).order_by()
+        .values('order__store_id', 'date')
+        .annotate(items_sold=Sum('quantity'))
+    )
+    for row in item_rows:
+        stats[row['order__store_id'], row['date']]['items_sold'] = row['items_sold']
+
+    return stats
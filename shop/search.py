@@ -0,0 +1,211 @@
+"""
+Full-text product search.
+
+Storefront and dashboard search go through a pluggable backend that returns
+product ids in relevance order:
+
+- SQLiteSearchBackend: an FTS5 virtual table (shop_product_fts) whose rowid is
+  the product id, ranked with bm25 (name weighted above description).
+  Kept in sync by the Product post_save/post_delete signals.
+- PostgresSearchBackend: a GIN expression index over to_tsvector(name,
+  description), ranked with ts_rank. Postgres maintains the index itself.
+- SimpleSearchBackend: the old icontains scan, for databases without either.
+
+PRODUCT_SEARCH_BACKEND may name a backend class explicitly; by default one is
+picked from the database vendor. Queryset .update() calls bypass the signals,
+so run `manage.py rebuild_search_index` after bulk edits to names or
+descriptions (the product importer calls index_many() itself).
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+from .pagination import KeysetPage, InvalidCursor, decode_cursor, encode_cursor
+
+FTS_TABLE = 'shop_product_fts'
+POSTGRES_DOCUMENT = "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))"
+
+# Weights for bm25(): name, description (the filter columns are unindexed)
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+
+def search_terms(query):
+    """Split free text into plain word tokens, dropping query syntax"""
+    return re.findall(r'\w+', query.lower())
+
+
+class SimpleSearchBackend:
+    """Substring match on name/description, newest first (no index)"""
+
+    def search(self, query, store=None, category_ids=None, available=None, offset=0, limit=None):
+        products = Product.objects.all()
+        for term in search_terms(query):
+            products = products.filter(Q(name__icontains=term) | Q(description__icontains=term))
+        if store is not None:
+            products = products.filter(store=store)
+        if category_ids is not None:
+            products = products.filter(category_id__in=category_ids)
+        if available is not None:
+            products = products.filter(available=available)
+        ids = products.order_by('-created_at', '-id').values_list('id', flat=True)
+        end = None if limit is None else offset + limit
+        return list(ids[offset:end])
+
+    def index(self, product):
+        pass
+
+    def index_many(self, products):
+        for product in products:
+            self.index(product)
+
+    def remove(self, product_id):
+        pass
+
+    def rebuild(self):
+        return Product.objects.count()
+
+
+class SQLiteSearchBackend(SimpleSearchBackend):
+    """FTS5 index with prefix matching and bm25 ranking"""
+
+    # The table itself is created by migration 0005_product_search_index
+    populate_sql = (
+        f'INSERT INTO {FTS_TABLE}(rowid, name, description, store_id, category_id, available) '
+        'SELECT id, name, description, store_id, category_id, available FROM shop_product'
+    )
+
+    def search(self, query, store=None, category_ids=None, available=None, offset=0, limit=None):
+        terms = search_terms(query)
+        if not terms:
+            return super().search(query, store, category_ids, available, offset, limit)
+
+        # Every term must match, as a prefix so "sho" finds "shoes"
+        sql = [f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s']
+        params = [' '.join(f'"{term}"*' for term in terms)]
+        if store is not None:
+            sql.append('AND store_id = %s')
+            params.append(store.pk)
+        if category_ids is not None:
+            category_ids = [int(category_id) for category_id in category_ids] or [0]
+            sql.append(f"AND category_id IN ({', '.join(['%s'] * len(category_ids))})")
+            params += category_ids
+        if available is not None:
+            sql.append('AND available = %s')
+            params.append(int(available))
+        sql.append(f'ORDER BY bm25({FTS_TABLE}, %s, %s), rowid DESC LIMIT %s OFFSET %s')
+        params += [NAME_WEIGHT, DESCRIPTION_WEIGHT, -1 if limit is None else limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def index(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description, store_id, category_id, available) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [product.pk, product.name, product.description,
+                 product.store_id, product.category_id, int(product.available)]
+            )
+
+    def index_many(self, products):
+        """Index a batch (e.g. from a bulk import) in two statements"""
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [[product.pk] for product in products])
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE}(rowid, name, description, store_id, category_id, available) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [[product.pk, product.name, product.description,
+                  product.store_id, product.category_id, int(product.available)] for product in products]
+            )
+
+    def remove(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(self.populate_sql)
+        return Product.objects.count()
+
+
+class PostgresSearchBackend(SimpleSearchBackend):
+    """to_tsvector/ts_rank over a GIN expression index"""
+
+    # The index itself is created by migration 0005_product_search_index
+
+    def search(self, query, store=None, category_ids=None, available=None, offset=0, limit=None):
+        terms = search_terms(query)
+        if not terms:
+            return super().search(query, store, category_ids, available, offset, limit)
+
+        # The WHERE expression must match the index expression exactly
+        tsquery = "to_tsquery('english', %s)"
+        sql = [f'SELECT id FROM shop_product WHERE {POSTGRES_DOCUMENT} @@ {tsquery}']
+        params = [' & '.join(f'{term}:*' for term in terms)]
+        if store is not None:
+            sql.append('AND store_id = %s')
+            params.append(store.pk)
+        if category_ids is not None:
+            category_ids = [int(category_id) for category_id in category_ids] or [0]
+            sql.append(f"AND category_id IN ({', '.join(['%s'] * len(category_ids))})")
+            params += category_ids
+        if available is not None:
+            sql.append('AND available = %s')
+            params.append(available)
+        sql.append(
+            f"ORDER BY ts_rank(setweight(to_tsvector('english', name), 'A') || "
+            f"setweight(to_tsvector('english', description), 'D'), {tsquery}) DESC, id DESC "
+            'LIMIT %s OFFSET %s'
+        )
+        params += [params[0], limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return [row[0] for row in cursor.fetchall()]
+
+
+def get_backend():
+    """Return the configured search backend instance"""
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return SimpleSearchBackend()
+
+
+def search_products(query, **filters):
+    """Return all matching products, best match first"""
+    ids = get_backend().search(query, **filters)
+    products = Product.objects.select_related('store', 'category').in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
+
+
+def search_page(query, cursor=None, per_page=24, **filters):
+    """
+    Return one page of ranked results as a KeysetPage, so templates can page
+    through search results the same way as through plain listings. The
+    cursor holds the offset into the ranking.
+    """
+    offset = 0
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 1 or not values[0].isdigit():
+            raise InvalidCursor(cursor)
+        offset = int(values[0])
+
+    ids = get_backend().search(query, offset=offset, limit=per_page + 1, **filters)
+    next_cursor = encode_cursor([offset + per_page]) if len(ids) > per_page else None
+    ids = ids[:per_page]
+    products = Product.objects.select_related('store', 'category').in_bulk(ids)
+    return KeysetPage([products[product_id] for product_id in ids if product_id in products], next_cursor)
@@ -0,0 +1,85 @@
+"""
+Storefront rendering of a theme's sections.
+
+A StoreTheme's section_plan (see shop.themes) lists the sections of the
+storefront, each rendered by its own template. Every rendered section is
+cached on its own, keyed by a hash of its settings plus the version of the
+data it shows, so:
+
+- editing one section's settings only re-renders that section;
+- sections that show catalog data (product_grid) are re-rendered when the
+  store's catalog version changes, the others never are.
+
+A page's sections are fetched with a single cache.get_many.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import versions
+from .models import Product, StoreTheme
+
+KEY_PREFIX = 'shop:section'
+
+
+def _product_grid(store, section_settings):
+    products = (Product.objects.filter(store=store, available=True)
+                .select_related('category')
+                .order_by('-created_at', '-id')[:section_settings['products_count']])
+    return {'products': list(products)}
+
+
+# Section type -> (extra template context, version of the data it uses)
+SECTION_DATA = {
+    'product_grid': (_product_grid, versions.get_version),
+}
+
+
+def settings_hash(section):
+    return hashlib.md5(json.dumps(section, sort_keys=True).encode()).hexdigest()
+
+
+def section_key(store, section, data_version=None):
+    return f'{KEY_PREFIX}:{store.pk}:{section["id"]}:{settings_hash(section)}:{data_version}'
+
+
+def _data_version(store, section, memo):
+    data = SECTION_DATA.get(section['type'])
+    if data is None:
+        return None
+    if data[1] not in memo:
+        memo[data[1]] = data[1](store.pk)
+    return memo[data[1]]
+
+
+def render_section(store, section):
+    """HTML of one section of a section plan (uncached)"""
+    context = {'store': store, 'section': section, 'settings': section['settings']}
+    data = SECTION_DATA.get(section['type'])
+    if data is not None:
+        context.update(data[0](store, section['settings']))
+    return render_to_string(section['template'], context)
+
+
+def render_sections(store, plan):
+    """HTML of all sections of a section plan, each cached separately"""
+    memo = {}
+    keys = [section_key(store, section, _data_version(store, section, memo)) for section in plan]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, section in zip(keys, plan):
+        if key not in cached:
+            rendered[key] = render_section(store, section)
+    if rendered:
+        cache.set_many(rendered, getattr(settings, 'SECTION_CACHE_TIMEOUT', 60 * 60 * 24))
+    return mark_safe(''.join(cached[key] if key in cached else rendered[key] for key in keys))
+
+
+def render_storefront(store):
+    """The store's rendered sections, or '' if its theme has none"""
+    plan = StoreTheme.objects.filter(store=store).values_list('section_plan', flat=True).first()
+    return render_sections(store, plan) if plan else ''
@@ -0,0 +1,148 @@
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import images, rollups, search, store_cache, themes, versions
+from .models import Store, Category, Product, StoreTheme, Order, OrderItem
+
+
+@receiver(pre_save, sender=Store)
+def remember_store_routing(sender, instance, **kwargs):
+    """Keep the old slug/domain so a rename also evicts the old cache entries"""
+    if instance.pk:
+        instance._previous_routing = (
+            Store.objects.filter(pk=instance.pk).values_list('slug', 'domain').first()
+        )
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def invalidate_store_routing(sender, instance, **kwargs):
+    """Evict cached host/slug lookups for a changed or deleted store"""
+    store_cache.invalidate(slug=instance.slug, domain=instance.domain)
+    previous = getattr(instance, '_previous_routing', None)
+    if previous:
+        store_cache.invalidate(slug=previous[0], domain=previous[1])
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the full-text search index in step with the catalog"""
+    search.get_backend().index(instance)
+
+
+@receiver(post_save, sender=Product)
+def queue_product_image(sender, instance, **kwargs):
+    """Resized copies of a new image are made in the background"""
+    images.queue_derivatives(instance.image)
+
+
+@receiver(pre_save, sender=StoreTheme)
+def compile_theme(sender, instance, **kwargs):
+    """Build the stylesheet and section plan once, not on every page view"""
+    themes.compile_theme(instance)
+
+
+@receiver(post_save, sender=StoreTheme)
+def queue_theme_logo(sender, instance, **kwargs):
+    images.queue_derivatives(instance.logo)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def bump_store_catalog_version(sender, instance, **kwargs):
+    """Cached storefront pages of a store go stale when it changes"""
+    versions.bump_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_version(sender, instance, **kwargs):
+    versions.bump_on_commit(instance.store_id)
+
+
+@receiver(post_save, sender=StoreTheme)
+@receiver(post_delete, sender=StoreTheme)
+def bump_theme_version(sender, instance, **kwargs):
+    versions.bump_on_commit(instance.store_id, versions.THEME)
+
+
+@receiver(pre_delete, sender=Store)
+def stop_store_rollups(sender, instance, **kwargs):
+    """The store's rollup rows are deleted with it; its orders needn't update them"""
+    rollups.store_deleting(instance.pk)
+
+
+@receiver(post_delete, sender=Store)
+def forget_deleted_store(sender, instance, **kwargs):
+    rollups.store_deleted(instance.pk)
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_totals(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_totals = (
+            Order.objects.filter(pk=instance.pk).values_list('status', 'total_amount').first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def roll_up_order(sender, instance, created, **kwargs):
+    """Keep StoreDailyStats in step with orders"""
+    previous = getattr(instance, '_previous_totals', None)
+    if created:
+        rollups.order_created(instance)
+    elif previous:
+        rollups.order_changed(instance, *previous)
+    instance._previous_totals = (instance.status, instance.total_amount)
+
+
+@receiver(post_delete, sender=Order)
+def roll_up_deleted_order(sender, instance, **kwargs):
+    rollups.order_deleted(instance)
+
+
+@receiver(pre_save, sender=OrderItem)
+def remember_item_quantity(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_quantity = (
+            OrderItem.objects.filter(pk=instance.pk).values_list('quantity', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=OrderItem)
+def roll_up_order_item(sender, instance, created, **kwargs):
+    previous = 0 if created else getattr(instance, '_previous_quantity', None)
+    if previous is not None:
+        rollups.items_sold(instance.order, instance.quantity - previous)
+    instance._previous_quantity = instance.quantity
+
+
+@receiver(post_delete, sender=OrderItem)
+def roll_up_deleted_order_item(sender, instance, **kwargs):
+    # During a cascade from Order the order row is still there at this point
+    order = Order.objects.filter(pk=instance.order_id).only('store_id', 'created_at').first()
+    if order:
+        rollups.items_sold(order, -instance.quantity)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def bump_orders_version(sender, instance, **kwargs):
+    """Order lists and dashboard numbers go stale; bumped after commit so
+    nothing is cached from the old data under the new version"""
+    versions.bump_on_commit(instance.store_id, versions.ORDERS)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def bump_order_item_version(sender, instance, **kwargs):
+    store_id = Order.objects.filter(pk=instance.order_id).values_list('store_id', flat=True).first()
+    if store_id:
+        versions.bump_on_commit(store_id, versions.ORDERS)
@@ -0,0 +1,90 @@
+"""
+Content-addressed media storage.
+
+Uploads to the directories in CONTENT_ADDRESSED_DIRS (product images, store
+logos, compiled theme stylesheets) are stored under their SHA-256 digest
+instead of their filename:
+
+    products/IMG_0001.png -> blobs/3f/3fa9...c1.png
+
+so the same file uploaded for many products or stores is kept once, and a
+blob's URL never points at different bytes, which lets browsers and CDNs
+cache it forever (see serve_media; in production the web server or CDN
+serving MEDIA_ROOT should send the same header for /media/blobs/). Files derived from a blob and named
+after it (shop.images derivatives) are saved under blobs/ as they are.
+
+Blobs are never deleted when a record changes, since others may share them;
+`manage.py gc_media` removes the ones nothing references any more.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.views.static import serve
+
+BLOB_DIR = 'blobs'
+
+# Blob URLs never change meaning
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Shown in the page by serve_media; anything else (HTML, SVG, uploaded
+# import files) is only offered as a download, so it can't run script on
+# the site's origin
+INLINE_CONTENT_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/css'}
+
+
+def content_digest(content):
+    """SHA-256 of a File, read in chunks; leaves it rewound"""
+    sha256 = hashlib.sha256()
+    for chunk in content.chunks():
+        sha256.update(chunk)
+    content.seek(0)
+    return sha256.hexdigest()
+
+
+def blob_name(digest, extension=''):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+def blob_digest(name):
+    """Digest of the blob a stored name belongs to (itself or its derivative), else None"""
+    if not name.startswith(f'{BLOB_DIR}/'):
+        return None
+    return posixpath.basename(name).split('.', 1)[0]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that stores uploads by content digest"""
+
+    def addressed_dirs(self):
+        return getattr(settings, 'CONTENT_ADDRESSED_DIRS', ['products', 'store_logos', 'themes'])
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if name.split('/', 1)[0] not in self.addressed_dirs():
+            return super().save(name, content, max_length)
+
+        extension = posixpath.splitext(name)[1].lower()
+        name = blob_name(content_digest(content), extension)
+        if self.exists(name):
+            # Already stored: identical bytes, nothing to write. Refresh the
+            # mtime so gc_media's grace period covers this upload too.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+def serve_media(request, path):
+    """Serve MEDIA_ROOT, marking content-addressed blobs as immutable"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if response.status_code != 200:
+        return response
+    response['X-Content-Type-Options'] = 'nosniff'
+    if response['Content-Type'].split(';')[0] not in INLINE_CONTENT_TYPES:
+        response['Content-Disposition'] = 'attachment'
+    if blob_digest(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,125 @@
+"""
+Two-tier cache for resolving the current store from a host or URL slug.
+
+Lookups go through a small in-process LRU (bounded, with a short TTL) first,
+then the shared Django cache, and only hit the database on a miss in both.
+Misses are cached too, since most requests arrive on the platform domain and
+never match a custom domain.
+
+Entries are dropped by the Store post_save/post_delete signals (see
+shop.signals). Other worker processes only see the change once their local
+entry expires, so STORE_CACHE_LOCAL_TIMEOUT bounds how stale routing can get.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Store
+
+# Stored in place of a store when the lookup found nothing
+MISSING = 'missing'
+
+KEY_PREFIX = 'shop:store'
+
+
+def _local_timeout():
+    return getattr(settings, 'STORE_CACHE_LOCAL_TIMEOUT', 30)
+
+
+def _shared_timeout():
+    return getattr(settings, 'STORE_CACHE_TIMEOUT', 300)
+
+
+def _max_entries():
+    return getattr(settings, 'STORE_CACHE_MAX_ENTRIES', 1024)
+
+
+class LocalStoreCache:
+    """Thread-safe LRU with a per-entry TTL"""
+
+    def __init__(self):
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + _local_timeout(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > _max_entries():
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalStoreCache()
+
+
+def _cache_key(kind, value):
+    return f'{KEY_PREFIX}:{kind}:{value}'
+
+
+def _lookup(kind, value):
+    key = _cache_key(kind, value)
+
+    store = local_cache.get(key)
+    if store is None:
+        store = cache.get(key)
+        if store is None:
+            store = Store.objects.filter(is_active=True, **{kind: value}).first() or MISSING
+            cache.set(key, store, _shared_timeout())
+        local_cache.set(key, store)
+
+    return store if isinstance(store, Store) else None
+
+
+def get_store_by_domain(host):
+    """Return the active store for a custom domain, or None"""
+    if not host:
+        return None
+    return _lookup('domain', host)
+
+
+def get_store_by_slug(slug):
+    """Return the active store for a slug, or None"""
+    if not slug:
+        return None
+    return _lookup('slug', slug)
+
+
+def invalidate(slug=None, domain=None):
+    """Drop cached routing entries for the given slug and/or domain"""
+    keys = []
+    if slug:
+        keys.append(_cache_key('slug', slug))
+    if domain:
+        keys.append(_cache_key('domain', domain))
+    for key in keys:
+        local_cache.delete(key)
+    if keys:
+        cache.delete_many(keys)
+
+
+def clear():
+    """Empty the in-process tier (the shared tier expires on its own)"""
+    local_cache.clear()
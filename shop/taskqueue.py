@@ -0,0 +1,242 @@
+"""
+Database-backed background task queue.
+
+Views enqueue work and return at once; `manage.py run_worker` picks tasks up
+and runs them on a thread pool. Tasks are plain functions decorated with
+@task and referenced by dotted path, with JSON-serialisable arguments:
+
+    @task
+    def send_receipt(order_id): ...
+
+    send_receipt.enqueue(args=[order.id], key=f'receipt:{order.id}')
+
+- Priorities: higher `priority` runs first, then oldest `run_at`.
+- Retries: a task that raises is retried with exponential backoff
+  (TASK_RETRY_DELAY * 2**n seconds) until max_attempts, then marked failed.
+- Idempotency: a task enqueued with a key that was used before is not
+  enqueued again; the existing Task is returned.
+- Workers run each claimed task as soon as a thread is free, and delete
+  finished tasks after TASK_RETENTION seconds (which frees their keys).
+- Claiming is one conditional UPDATE per task, so any number of workers
+  (threads or processes, on any host) can share the queue. A running task's
+  lock is refreshed every TASK_LOCK_TIMEOUT / 3 seconds; one whose lock is
+  older than TASK_LOCK_TIMEOUT (its worker died) is claimed again. Outcomes
+  are only recorded by the claim that still holds the lock.
+
+Enqueueing inside a transaction is safe: workers only see the task once the
+transaction commits. With TASK_QUEUE_EAGER = True tasks run inline instead.
+"""
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def task(func):
+    """Register a function as a task and give it an .enqueue() shortcut"""
+    func.task_name = f'{func.__module__}.{func.__qualname__}'
+
+    def enqueue_func(args=(), kwargs=None, **options):
+        return enqueue(func.task_name, args, kwargs, **options)
+
+    func.enqueue = enqueue_func
+    return func
+
+
+def enqueue(name, args=(), kwargs=None, priority=0, key=None, run_at=None, max_attempts=None):
+    """Queue a call to the @task at dotted path `name` and return its Task"""
+    fields = {
+        'name': name,
+        'args': list(args),
+        'kwargs': kwargs or {},
+        'priority': priority,
+        'key': key,
+        'run_at': run_at or timezone.now(),
+        'max_attempts': max_attempts or _setting('TASK_MAX_ATTEMPTS', 3),
+    }
+    if key is not None:
+        existing = Task.objects.filter(key=key).first()
+        if existing:
+            return existing
+    try:
+        with transaction.atomic():
+            queued = Task.objects.create(**fields)
+    except IntegrityError:
+        if key is None:
+            raise
+        # Enqueued concurrently under the same key
+        return Task.objects.get(key=key)
+
+    if _setting('TASK_QUEUE_EAGER', False):
+        queued.status, queued.locked_at, queued.attempts = 'running', timezone.now(), 1
+        queued.save(update_fields=['status', 'locked_at', 'attempts'])
+        execute(queued)
+    return queued
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=_setting('TASK_LOCK_TIMEOUT', 600))
+    return Q(status='queued', run_at__lte=now) | Q(status='running', locked_at__lt=stale)
+
+
+def claim(limit=1, names=None):
+    """Lock up to `limit` due tasks for this worker and return them"""
+    now = timezone.now()
+    candidates = Task.objects.filter(_claimable(now))
+    if names:
+        candidates = candidates.filter(name__in=names)
+    claimed = []
+    for task_id in candidates.order_by('-priority', 'run_at', 'id').values_list('id', flat=True)[:limit * 2]:
+        # Only one worker's UPDATE can match the still-claimable row
+        if Task.objects.filter(_claimable(now), pk=task_id).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1
+        ):
+            claimed.append(task_id)
+            if len(claimed) == limit:
+                break
+    return list(Task.objects.filter(pk__in=claimed).order_by('-priority', 'run_at', 'id'))
+
+
+def _held(queued):
+    # Each claim bumps attempts, so it identifies the claim holding the lock
+    return Task.objects.filter(pk=queued.pk, status='running', attempts=queued.attempts)
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps a claimed task's lock fresh while it runs"""
+
+    def __init__(self, queued):
+        super().__init__(name=f'task-{queued.pk}-heartbeat', daemon=True)
+        self.queued = queued
+        self.done = threading.Event()
+
+    def run(self):
+        interval = _setting('TASK_LOCK_TIMEOUT', 600) / 3
+        try:
+            while not self.done.wait(interval):
+                if not _held(self.queued).update(locked_at=timezone.now()):
+                    break
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.done.set()
+
+
+def execute(queued):
+    """Run one claimed task and record the outcome; returns True on success"""
+    heartbeat = _Heartbeat(queued)
+    heartbeat.start()
+    try:
+        func = import_string(queued.name)
+        if not hasattr(func, 'task_name'):
+            raise ImportError(f'{queued.name} is not a @task')
+        result = func(*queued.args, **queued.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Task %s (%s) failed', queued.pk, queued.name)
+        attempts = max(queued.attempts, 1)
+        if attempts < queued.max_attempts:
+            delay = _setting('TASK_RETRY_DELAY', 10) * 2 ** (attempts - 1)
+            outcome = dict(status='queued', run_at=timezone.now() + timedelta(seconds=delay))
+        else:
+            outcome = dict(status='failed')
+        _record(queued, locked_at=None, last_error=error, updated_at=timezone.now(), **outcome)
+        return False
+    finally:
+        heartbeat.stop()
+
+    _record(queued, status='done', locked_at=None, result=result, updated_at=timezone.now())
+    return True
+
+
+def _record(queued, **outcome):
+    if not _held(queued).update(**outcome):
+        logger.warning('Task %s (%s) lost its lock; outcome not recorded', queued.pk, queued.name)
+
+
+def _execute_in_thread(queued):
+    close_old_connections()
+    try:
+        return execute(queued)
+    finally:
+        close_old_connections()
+
+
+def prune():
+    """Delete tasks that finished more than TASK_RETENTION seconds ago; returns how many"""
+    cutoff = timezone.now() - timedelta(seconds=_setting('TASK_RETENTION', 7 * 24 * 60 * 60))
+    finished = Task.objects.filter(status__in=['done', 'failed'], updated_at__lt=cutoff)
+    deleted = 0
+    # In batches, so no single statement locks much of the table
+    while batch := list(finished.values_list('id', flat=True)[:1000]):
+        deleted += Task.objects.filter(pk__in=batch).delete()[0]
+    return deleted
+
+
+class Worker:
+    """Claims due tasks and runs them on a pool of `concurrency` threads"""
+
+    def __init__(self, concurrency=None, poll_interval=None, names=None):
+        self.concurrency = concurrency or _setting('TASK_WORKER_CONCURRENCY', 4)
+        self.poll_interval = poll_interval or _setting('TASK_POLL_INTERVAL', 1.0)
+        self.names = names
+        self.stopping = False
+        self.next_prune = 0
+
+    def prune_if_due(self):
+        now = time.monotonic()
+        if now >= self.next_prune:
+            self.next_prune = now + _setting('TASK_PRUNE_INTERVAL', 60 * 60)
+            prune()
+
+    def run_once(self):
+        """Run one batch of due tasks in this thread; returns how many were run"""
+        tasks = claim(self.concurrency, self.names)
+        for queued in tasks:
+            execute(queued)
+        return len(tasks)
+
+    def run(self, burst=False):
+        """Process tasks until stopped (or, in burst mode, until none are due)"""
+        if self.concurrency == 1:
+            while not self.stopping:
+                self.prune_if_due()
+                if self.run_once():
+                    continue
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='task') as pool:
+            running = set()
+            while not self.stopping:
+                self.prune_if_due()
+                free = self.concurrency - len(running)
+                tasks = claim(free, self.names) if free else []
+                running.update(pool.submit(_execute_in_thread, queued) for queued in tasks)
+                if not running:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+                # Claim more as soon as a thread frees up; poll meanwhile if threads are idle
+                timeout = None if len(tasks) == free else self.poll_interval
+                running = wait(running, timeout, FIRST_COMPLETED).not_done
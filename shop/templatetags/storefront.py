@@ -0,0 +1,64 @@
+from django import template
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.template.loader import get_template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from shop import versions
+from shop.images import FORMATS, derivative_url, ready_widths, srcset
+from shop.models import StoreTheme
+from shop.page_cache import hole_marker, is_rendering_for_cache
+
+register = template.Library()
+
+# Theme stylesheet URLs are cached per theme version, so this only bounds
+# how long unused entries linger
+THEME_URL_TIMEOUT = 60 * 60 * 24
+
+
+@register.simple_tag(takes_context=True)
+def dynamic(context, template_name):
+    """
+    Include a per-visitor snippet (cart badge, messages). Inside a page that
+    is being rendered for the page cache this leaves a marker instead, which
+    is filled in for each visitor when the page is served.
+    """
+    request = context.get('request')
+    if request is not None and is_rendering_for_cache(request):
+        return mark_safe(hole_marker(template_name))
+    return get_template(template_name).render(context.flatten(), request)
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes='100vw', **attrs):
+    """
+    <picture> for an uploaded image: WebP and JPEG srcsets of its resized
+    derivatives, so the browser fetches the smallest one that fits `sizes`.
+    Falls back to a plain <img> of the original until they exist.
+    Extra keyword arguments (class, style, ...) go on the <img>.
+    """
+    extra = format_html_join('', ' {}="{}"', sorted(attrs.items()))
+    widths = ready_widths(image)
+    if not widths:
+        return format_html('<img src="{}" alt="{}" loading="lazy" decoding="async"{}>', image.url, alt, extra)
+    return format_html(
+        '<picture><source type="{}" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"{}></picture>',
+        FORMATS['webp'][1], srcset(image.name, widths, 'webp'), sizes,
+        derivative_url(image.name, widths[-1], 'jpg'), srcset(image.name, widths, 'jpg'), sizes, alt, extra,
+    )
+
+
+@register.simple_tag
+def theme_stylesheet(store):
+    """<link> to the store's compiled theme CSS, if it has one (no query once cached)"""
+    if not store:
+        return ''
+    key = f'shop:theme-css:{store.pk}:{versions.get_version(store.pk, versions.THEME)}'
+    url = cache.get(key)
+    if url is None:
+        name = StoreTheme.objects.filter(store=store).values_list('stylesheet', flat=True).first()
+        url = default_storage.url(name) if name else ''
+        cache.set(key, url, THEME_URL_TIMEOUT)
+    return format_html('<link rel="stylesheet" href="{}">', url) if url else ''
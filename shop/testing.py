@@ -0,0 +1,53 @@
+"""
+Test helpers shared by the shop and dashboard tests
+"""
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core import signing
+from django.test import override_settings
+
+from .cart import COOKIE_SALT, encode_lines
+from .models import Category, Product, Store
+
+
+class TempMediaMixin:
+    """Points MEDIA_ROOT at a temporary directory, removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class ShopTestMixin:
+    """Builds a store with a category and a handful of products"""
+
+    def create_store(self, name='Test Store', owner=None):
+        if owner is None:
+            owner = User.objects.create_user(f'{name.lower().replace(" ", "-")}-owner', password='pass')
+        store = Store.objects.create(name=name, owner=owner)
+        category = Category.objects.create(name='General', store=store)
+        return store, category
+
+    def create_products(self, store, category, count, stock=100, price='10.00'):
+        return [
+            Product.objects.create(
+                name=f'{store.name} Product {i}',
+                description='A product',
+                price=Decimal(price),
+                stock=stock,
+                category=category,
+                store=store,
+            )
+            for i in range(count)
+        ]
+
+    def fill_cart(self, products, quantity=1):
+        lines = {product.id: quantity for product in products}
+        self.client.cookies['cart'] = signing.dumps(encode_lines(lines), salt=COOKIE_SALT, compress=True)
@@ -1,4 +1,1224 @@
 # Tests for shop app
-from django.test import TestCase
+import os
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection, transaction
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import rollups, sections, store_cache, versions
+from .cart import COOKIE_SALT, MAX_QUANTITY, CacheCartBackend, Cart, CookieCartBackend, cart_count
+from .checkout import OutOfStock, place_order
+from .checks import check_shared_cache
+from .context_processors import cart_processor
+from .middleware import StoreMiddleware
+from .models import Category, Order, OrderItem, Product, RelatedProduct, Store, StoreDailyStats, StoreTheme, Task
+from .related import MAX_BASKET_SIZE, co_occurrence, rebuild_related
+from .search import search_products
+from .storage import serve_media
+from .taskqueue import Worker, claim, enqueue, execute, prune, task
+from .testing import ShopTestMixin, TempMediaMixin
+from .themes import MAX_GRID_PRODUCTS, ThemeError, section_plan
+
+
+class StoreRoutingTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        store_cache.clear()
+        self.store, _ = self.create_store()
+        self.store.domain = 'shop.example.com'
+        self.store.save()
+        self.factory = RequestFactory()
+        self.middleware = StoreMiddleware(lambda request: None)
+
+    def route(self, path, host='platform.example.com'):
+        request = self.factory.get(path, HTTP_HOST=host)
+        response = self.middleware.process_request(request)
+        return request, response
+
+    def test_steady_state_routing_does_not_query(self):
+        self.assertEqual(self.route(f'/store/{self.store.slug}/')[0].store, self.store)
+        self.assertEqual(self.route('/', host='shop.example.com')[0].store, self.store)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.route(f'/store/{self.store.slug}/')[0].store, self.store)
+            request, _ = self.route('/', host='shop.example.com')
+            self.assertEqual(request.store, self.store)
+            self.assertTrue(request.is_custom_domain)
+            self.assertFalse(self.route('/')[0].store)
+
+    def test_renaming_evicts_old_routes(self):
+        old_slug = self.store.slug
+        self.assertEqual(self.route(f'/store/{old_slug}/')[0].store, self.store)
+        self.assertEqual(self.route('/', host='shop.example.com')[0].store, self.store)
+        self.store.slug = 'renamed'
+        self.store.domain = 'renamed.example.com'
+        self.store.save()
+        self.assertFalse(self.route(f'/store/{old_slug}/')[0].store)
+        self.assertFalse(self.route('/', host='shop.example.com')[0].store)
+        self.assertEqual(self.route('/store/renamed/')[0].store, self.store)
+        self.assertEqual(self.route('/', host='renamed.example.com')[0].store, self.store)
+
+    def test_store_is_resolved_lazily(self):
+        with self.assertNumQueries(0):
+            request, response = self.route('/static/site.css')
+            self.assertIsNone(response)
+            self.assertIsNone(request.store)
+            self.assertFalse(request.is_custom_domain)
+            request, _ = self.route('/', host='shop.example.com')
+        with self.assertNumQueries(1):
+            self.assertEqual(request.store, self.store)
+
+    def test_blocked_paths_are_forbidden_on_custom_domains(self):
+        for path in ['/admin/', '/dashboard/', '/my-stores/', '/create-store/']:
+            self.assertEqual(self.route(path, host='shop.example.com')[1].status_code, 403)
+            self.assertFalse(self.route(path)[1])
+
+
+class CartHydrationTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 30)
+
+    def test_view_cart_query_count_is_constant(self):
+        # products only, however many lines the cart has
+        for size in (1, 30):
+            self.fill_cart(self.products[:size])
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('view_cart'))
+            self.assertEqual(len(response.context['cart_items']), size)
+            self.assertEqual(response.context['total'], Decimal('10.00') * size)
+
+    def test_checkout_form_query_count_is_constant(self):
+        user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(user)
+        # session + user + products
+        for size in (1, 30):
+            self.fill_cart(self.products[:size])
+            with self.assertNumQueries(3):
+                response = self.client.get(reverse('checkout'))
+            self.assertEqual(len(response.context['cart_items']), size)
+
+    def test_missing_products_are_skipped(self):
+        self.fill_cart(self.products[:2])
+        self.products[0].delete()
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual([item['product'] for item in response.context['cart_items']], [self.products[1]])
+
+
+class CartStorageTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        store_cache.clear()
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 2)
+        # Store routing is cached in steady state (see StoreRoutingTests)
+        store_cache.get_store_by_domain('testserver')
+
+    def cart_lines(self):
+        response = self.client.get(reverse('view_cart'))
+        return {item['product'].id: item['quantity'] for item in response.context['cart_items']}
+
+    def exercise_cart(self):
+        first, second = self.products
+        # Only the product lookup: nothing is written to the database
+        with self.assertNumQueries(1):
+            self.client.get(reverse('add_to_cart', args=[first.id]))
+        self.client.get(reverse('add_to_cart', args=[first.id]))
+        self.client.get(reverse('add_to_cart', args=[second.id]))
+        self.assertEqual(self.cart_lines(), {first.id: 2, second.id: 1})
+        with self.assertNumQueries(0):
+            self.client.post(reverse('update_cart', args=[first.id]), {'quantity': 5})
+            self.client.get(reverse('remove_from_cart', args=[second.id]))
+        self.assertEqual(self.cart_lines(), {first.id: 5})
+
+    def test_cookie_backend(self):
+        self.exercise_cart()
+        self.assertEqual(signing.loads(self.client.cookies['cart'].value, salt=COOKIE_SALT),
+                         f'{self.products[0].id}:5')
+
+    @override_settings(CART_BACKEND='shop.cart.CacheCartBackend')
+    def test_cache_backend(self):
+        self.exercise_cart()
+        cart_id, count, _ = signing.loads(self.client.cookies['cart'].value, salt=COOKIE_SALT).split(':')
+        self.assertEqual(cache.get(f'shop:cart:{cart_id}'), f'{self.products[0].id}:5')
+        self.assertEqual(count, '5')
+
+    @override_settings(CART_BACKEND='shop.cart.CacheCartBackend')
+    def test_cache_backend_cookie_changes_with_the_contents(self):
+        first, second = self.products[:2]
+        self.client.get(reverse('add_to_cart', args=[first.id]))
+        self.client.get(reverse('add_to_cart', args=[second.id]))
+        cookie = self.client.cookies['cart'].value
+        # Same unit count, different lines
+        self.client.post(reverse('cart_update'), {'lines': {first.id: 2, second.id: 0}},
+                         content_type='application/json')
+        self.assertNotEqual(self.client.cookies['cart'].value, cookie)
+        self.assertEqual(self.cart_lines(), {first.id: 2})
+
+    @override_settings(CART_BACKEND='shop.cart.CacheCartBackend')
+    def test_cache_backend_reads_cookies_without_a_digest(self):
+        cache.set('shop:cart:old', f'{self.products[0].id}:2')
+        self.client.cookies['cart'] = signing.dumps('old:2', salt=COOKIE_SALT)
+        self.assertEqual(self.cart_lines(), {self.products[0].id: 2})
+
+    def test_tampered_cookie_is_an_empty_cart(self):
+        self.client.cookies['cart'] = f'{self.products[0].id}:5'
+        self.assertEqual(self.cart_lines(), {})
+
+    @override_settings(CART_BACKEND='shop.cart.SessionCartBackend')
+    def test_session_backend_reads_old_carts(self):
+        session = self.client.session
+        session['cart'] = {str(self.products[0].id): {'quantity': 3, 'price': '10.00', 'name': 'x'}}
+        session.save()
+        self.assertEqual(self.cart_lines(), {self.products[0].id: 3})
+
+
+class CartCountTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store, self.category = self.create_store()
+        self.product = self.create_products(self.store, self.category, 1)[0]
+
+    def render_count(self, template='{{ cart_count }}'):
+        request = RequestFactory().get('/')
+        request.COOKIES.update({name: morsel.value for name, morsel in self.client.cookies.items()})
+        context = cart_processor(request)
+        return Template(template).render(Context(context)), request
+
+    def test_template_without_badge_does_not_load_cart(self):
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        with patch.object(CookieCartBackend, 'load') as load:
+            self.render_count('no badge')
+        load.assert_not_called()
+
+    def test_count_follows_changes(self):
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.post(reverse('update_cart', args=[self.product.id]), {'quantity': 4})
+        self.assertEqual(self.render_count()[0], '4')
+
+    @override_settings(CART_BACKEND='shop.cart.CacheCartBackend')
+    def test_cache_backend_counts_from_the_cookie(self):
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        with patch.object(CacheCartBackend, 'load') as load:
+            self.assertEqual(self.render_count()[0], '2')
+        load.assert_not_called()
+
+    @override_settings(CART_BACKEND='shop.cart.SessionCartBackend')
+    def test_session_backend_skips_sessionless_visitors(self):
+        request = RequestFactory().get('/')
+        request.session = Mock()
+        self.assertEqual(cart_count(request), 0)
+        request.session.get.assert_not_called()
+
+        self.client.get(reverse('add_to_cart', args=[self.product.id]))
+        self.assertEqual(self.client.session['cart_count'], 1)
+
+    def test_cart_keeps_its_count(self):
+        cart = Cart({1: 2})
+        cart.add(1, 3)
+        cart.set(2, MAX_QUANTITY + 5)
+        self.assertEqual(cart.count, 5 + MAX_QUANTITY)
+        cart.remove(1)
+        self.assertEqual(cart.count, MAX_QUANTITY)
+        cart.clear()
+        self.assertEqual(cart.count, 0)
+
+
+class CartApiTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.first, self.second = self.create_products(self.store, self.category, 2)
+
+    def post_json(self, name, data):
+        return self.client.post(reverse(name), data, content_type='application/json')
+
+    def cookie_lines(self):
+        return signing.loads(self.client.cookies['cart'].value, salt=COOKIE_SALT)
+
+    def test_batch_changes_return_the_changed_lines(self):
+        # One query for the products, none to save the cart
+        with self.assertNumQueries(1):
+            response = self.post_json('cart_add', {'lines': {self.first.id: 2, self.second.id: 1}})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['count'], data['lines']), (3, 2))
+        self.assertEqual(data['total'], str(self.first.price * 2 + self.second.price))
+
+        data = self.post_json('cart_update', {'lines': {self.first.id: 5}}).json()
+        self.assertEqual([(item['product_id'], item['quantity']) for item in data['items']], [(self.first.id, 5)])
+        self.assertEqual(data['items'][0]['subtotal'], str(self.first.price * 5))
+
+        data = self.post_json('cart_remove', {'product_ids': [self.second.id]}).json()
+        self.assertEqual((data['count'], data['lines']), (5, 1))
+        self.assertEqual(self.cookie_lines(), f'{self.first.id}:5')
+
+    def test_form_post(self):
+        response = self.client.post(reverse('cart_add'), {'product_id': self.first.id, 'quantity': 3})
+        self.assertEqual(response.json()['count'], 3)
+
+    def test_summary_drops_deleted_products(self):
+        self.post_json('cart_add', {'lines': {self.first.id: 1, self.second.id: 1}})
+        self.second.delete()
+        response = self.client.get(reverse('cart_summary'))
+        self.assertIn('csrftoken', response.cookies)
+        self.assertEqual([item['product_id'] for item in response.json()['items']], [self.first.id])
+        self.assertEqual(self.cookie_lines(), f'{self.first.id}:1')
+
+    def test_bad_payloads(self):
+        bodies = ['not json', '[]', '{}', '{"lines": {"x": 1}}', '{"lines": {}}', '{"lines": [1]}',
+                  '{"product_ids": 5}', '{"product_ids": [[1]]}', '{"product_id": {"a": 1}}',
+                  '{"product_id": 1, "quantity": 1.5}', '{"product_id": true}', '{"lines": {"1": 1e999}}',
+                  '{"product_id": 99999999999999999999999}', '{"product_id": -1}']
+        for body in bodies:
+            response = self.client.post(reverse('cart_add'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.client.get(reverse('cart_add')).status_code, 405)
+
+
+class CheckoutTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 30, stock=5)
+        self.user = User.objects.create_user('buyer', password='pass')
+
+    def cart_for(self, products, quantity=1):
+        return {product.id: quantity for product in products}
+
+    def test_place_order_query_count_is_constant(self):
+        # The first order of the day also creates the daily stats row
+        place_order(self.user, self.cart_for(self.products[:1]), 'Somewhere')
+        # products, stock update, order insert, items insert, 2 rollup updates (+ savepoint)
+        for size in (1, 30):
+            with self.assertNumQueries(8):
+                order, = place_order(self.user, self.cart_for(self.products[:size]), 'Somewhere')
+            self.assertEqual(order.items.count(), size)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 2)
+        self.assertEqual(Product.objects.get(id=self.products[29].id).stock, 4)
+
+    def test_cart_is_split_into_one_order_per_store(self):
+        other_store, other_category = self.create_store('Other Store')
+        other_products = self.create_products(other_store, other_category, 10, price='3.00')
+        cart = self.cart_for(self.products[:20] + other_products)
+        place_order(self.user, self.cart_for(self.products[20:21] + other_products[:1]), 'Somewhere')
+        # an order insert and two rollup updates per store, items still inserted together
+        with self.assertNumQueries(11):
+            orders = place_order(self.user, cart, 'Somewhere')
+        self.assertEqual([order.store for order in orders], [self.store, other_store])
+        self.assertEqual([order.total_amount for order in orders], [Decimal('200.00'), Decimal('30.00')])
+        self.assertEqual([order.items.count() for order in orders], [20, 10])
+        self.assertEqual(
+            list(StoreDailyStats.objects.order_by('store_id').values_list('orders', 'items_sold')),
+            [(2, 21), (2, 11)]
+        )
+
+    def test_oversell_rolls_back_everything(self):
+        cart = self.cart_for(self.products[:2])
+        cart[self.products[1].id] = 6
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, cart, 'Somewhere')
+        self.assertEqual(ctx.exception.products, [self.products[1]])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 5)
+
+    def test_stale_stock_is_rejected_by_the_update(self):
+        cart = self.cart_for(self.products[:2], quantity=3)
+        # Another buyer takes stock after our cart was priced
+        Product.objects.filter(id=self.products[1].id).update(stock=2)
+        with self.assertRaises(OutOfStock) as ctx:
+            place_order(self.user, cart, 'Somewhere')
+        self.assertEqual(ctx.exception.products, [self.products[1]])
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 5)
+
+    def test_checkout_view_clears_cart(self):
+        self.client.force_login(self.user)
+        self.fill_cart(self.products[:3], quantity=2)
+        response = self.client.post(reverse('checkout'), {'shipping_address': 'Somewhere'})
+        order = Order.objects.get()
+        self.assertRedirects(response, reverse('order_success', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.total_amount, Decimal('60.00'))
+        self.assertEqual(response.cookies['cart'].value, '')
+
+
+class ConcurrentCheckoutTests(ShopTestMixin, TransactionTestCase):
+    """
+    Many buyers racing for a low-stock product. Runs against whatever
+    database is configured (DATABASE_URL=postgres://... for Postgres).
+    """
+
+    buyers = 12
+    stock = 3
+
+    def test_parallel_checkouts_never_oversell(self):
+        store, category = self.create_store()
+        product, = self.create_products(store, category, 1, stock=self.stock)
+        users = [User.objects.create_user(f'buyer{i}') for i in range(self.buyers)]
+        cart = {product.id: 1}
+        barrier = threading.Barrier(self.buyers)
+        results = []
+
+        def buy(user):
+            barrier.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        place_order(user, cart, 'Somewhere')
+                        results.append(True)
+                        return
+                    except OperationalError:
+                        # SQLite refuses concurrent writers instead of queueing them
+                        time.sleep(0.01)
+            except OutOfStock:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(results), self.buyers)
+        self.assertEqual(results.count(True), self.stock)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), self.stock)
+
+
+class ProductListTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 30)
+
+    def test_keyset_pages_cover_catalog_once(self):
+        seen = []
+        url = reverse('product_list')
+        params = {}
+        while True:
+            response = self.client.get(url, params)
+            page = response.context['page']
+            seen.extend(product.id for product in page)
+            if not page.has_next():
+                break
+            params = {'after': page.next_cursor}
+        expected = Product.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_category_filter_is_scoped_by_slug_not_a_single_category(self):
+        other_store, other_category = self.create_store('Other Store')
+        other, = self.create_products(other_store, other_category, 1)
+        response = self.client.get(reverse('product_list'), {'category': 'general', 'search': 'Other'})
+        self.assertEqual(list(response.context['products']), [other])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse('product_list'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.shoe = Product.objects.create(
+            name='Running Shoes', description='Light and fast', price=1, stock=1,
+            category=self.category, store=self.store)
+        self.sock = Product.objects.create(
+            name='Wool Socks', description='Great with running shoes', price=1, stock=1,
+            category=self.category, store=self.store)
+
+    def test_name_matches_rank_first_and_prefixes_match(self):
+        self.assertEqual(search_products('run sho', store=self.store), [self.shoe, self.sock])
+
+    def test_results_are_scoped_to_store(self):
+        other_store, other_category = self.create_store('Other Store')
+        self.create_products(other_store, other_category, 1)
+        self.assertEqual(search_products('product', store=self.store), [])
+        self.assertEqual(len(search_products('product', store=other_store)), 1)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.sock.name = 'Cotton Socks'
+        self.sock.description = 'Soft'
+        self.sock.save()
+        self.assertEqual(search_products('running'), [self.shoe])
+        self.shoe.delete()
+        self.assertEqual(search_products('running'), [])
+        self.assertEqual(search_products('cotton'), [self.sock])
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(search_products('"shoes* -('), [self.shoe, self.sock])
+
+    def test_storefront_search_pages_through_ranking(self):
+        for i in range(30):
+            Product.objects.create(name=f'Shoe {i}', description='x', price=1, stock=1,
+                                   category=self.category, store=self.store)
+        response = self.client.get(reverse('product_list'), {'search': 'shoe'})
+        page = response.context['page']
+        self.assertEqual(len(page), 24)
+        response = self.client.get(reverse('product_list'), {'search': 'shoe', 'after': page.next_cursor})
+        self.assertEqual(len(response.context['page']), 8)
+        self.assertFalse(response.context['page'].has_next())
+
+
+class StorefrontPageCacheTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 3)
+
+    def test_anonymous_repeat_hit_skips_the_database(self):
+        url = reverse('product_list')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+
+    def test_catalog_change_invalidates_cached_pages(self):
+        url = reverse('product_list')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = 'Renamed Product'
+            self.products[0].save()
+        self.assertContains(self.client.get(url), 'Renamed Product')
+
+    def test_cart_badge_and_messages_are_per_visitor(self):
+        url = reverse('product_list')
+        self.client.get(url)  # warm the cache with an empty cart
+        self.client.get(reverse('add_to_cart', args=[self.products[0].id]))
+        response = self.client.get(url)
+        self.assertContains(response, '<span class="cart-badge">1</span>', html=True)
+        self.assertContains(response, 'added to cart!')
+        self.assertNotContains(self.client.get(url), 'added to cart!')
+        self.assertNotContains(Client().get(url), '<span class="cart-badge">')
+
+
+class DailyStatsTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.product, = self.create_products(self.store, self.category, 1)
+        self.user = User.objects.create_user('buyer', password='pass')
+
+    def stats(self):
+        return StoreDailyStats.objects.values('orders', 'revenue', 'items_sold', 'pending', 'shipped').get()
+
+    def test_rollup_follows_order_lifecycle(self):
+        order, = place_order(self.user, {self.product.id: 3}, 'Somewhere')
+        self.assertEqual(self.stats(), {
+            'orders': 1, 'revenue': Decimal('30.00'), 'items_sold': 3, 'pending': 1, 'shipped': 0,
+        })
+
+        order.status = 'shipped'
+        order.save()
+        self.assertEqual(self.stats()['pending'], 0)
+        self.assertEqual(self.stats()['shipped'], 1)
+
+        order.delete()
+        self.assertEqual(self.stats(), {
+            'orders': 0, 'revenue': Decimal('0.00'), 'items_sold': 0, 'pending': 0, 'shipped': 0,
+        })
+
+    def test_rebuild_command_reconciles_rows(self):
+        place_order(self.user, {self.product.id: 2}, 'Somewhere')
+        expected = self.stats()
+        StoreDailyStats.objects.update(orders=99)
+
+        out = StringIO()
+        call_command('rebuild_store_stats', '--check', stdout=out)
+        self.assertIn('1 rollup rows out of date', out.getvalue())
+
+        call_command('rebuild_store_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), expected)
+
+    def test_deleting_a_store_with_orders(self):
+        place_order(self.user, {self.product.id: 2}, 'Somewhere')
+        other_store, other_category = self.create_store('Other Store')
+        other_product, = self.create_products(other_store, other_category, 1)
+        place_order(self.user, {other_product.id: 1}, 'Somewhere')
+
+        self.store.delete()
+        # Deferred foreign keys would fail at commit if a row were recreated
+        connection.check_constraints()
+        self.assertEqual(list(StoreDailyStats.objects.values_list('store_id', flat=True)), [other_store.pk])
+
+        other_store.owner.delete()
+        connection.check_constraints()
+        self.assertFalse(StoreDailyStats.objects.exists())
+
+    def test_negative_delta_never_creates_a_row(self):
+        rollups.apply(self.store.pk, timezone.localdate(), orders=-1, revenue=Decimal('-5.00'))
+        self.assertFalse(StoreDailyStats.objects.exists())
+
+
+class OrderHistoryTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 3)
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(self.user)
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, store=self.store, total_amount=Decimal('30.00'),
+                                         shipping_address='Somewhere')
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=1, price=product.price)
+                for product in self.products
+            ])
+
+    def test_my_orders_query_count_is_constant(self):
+        # session, user, orders (with store), items (with products)
+        for count in (1, 200):
+            Order.objects.all().delete()
+            self.create_orders(count)
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('my_orders'))
+            self.assertEqual(len(response.context['orders']), min(count, 20))
+        self.assertContains(response, self.products[2].name)
+
+    def test_my_orders_pages_through_history(self):
+        self.create_orders(25)
+        page = self.client.get(reverse('my_orders')).context['page']
+        response = self.client.get(reverse('my_orders'), {'after': page.next_cursor})
+        self.assertEqual(len(response.context['orders']), 5)
+        self.assertFalse(response.context['page'].has_next())
+
+    def test_with_items_avoids_per_order_queries(self):
+        self.create_orders(50)
+        with self.assertNumQueries(2):
+            lines = [str(order) + str(item) for order in Order.objects.with_items() for item in order.items.all()]
+        self.assertEqual(len(lines), 150)
+
+
+CALLS = []
+
+
+@task
+def record_call(value):
+    CALLS.append(value)
+    return value
+
+
+@task
+def always_fails():
+    raise RuntimeError('boom')
+
+
+RELEASE = threading.Event()
+
+
+@task
+def wait_for_release():
+    RELEASE.wait(10)
+    return 'released'
+
+
+@override_settings(TASK_RETRY_DELAY=0)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_runs_by_priority_and_records_result(self):
+        record_call.enqueue(args=['low'])
+        record_call.enqueue(args=['high'], priority=10)
+        Worker(concurrency=1).run(burst=True)
+        self.assertEqual(CALLS, ['high', 'low'])
+        self.assertEqual(list(Task.objects.values_list('status', 'result').order_by('id')),
+                         [('done', 'low'), ('done', 'high')])
+
+    def test_idempotency_key_enqueues_once(self):
+        first = record_call.enqueue(args=[1], key='once')
+        second = record_call.enqueue(args=[2], key='once')
+        self.assertEqual(first.pk, second.pk)
+        Worker(concurrency=1).run(burst=True)
+        record_call.enqueue(args=[3], key='once')
+        Worker(concurrency=1).run(burst=True)
+        self.assertEqual(CALLS, [1])
+
+    def test_failures_are_retried_then_marked_failed(self):
+        always_fails.enqueue(max_attempts=2)
+        worker = Worker(concurrency=1)
+        with self.assertLogs('shop.taskqueue', 'ERROR'):
+            self.assertEqual(worker.run_once(), 1)
+        failed = Task.objects.get()
+        self.assertEqual((failed.status, failed.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: boom', failed.last_error)
+        with self.assertLogs('shop.taskqueue', 'ERROR'):
+            worker.run(burst=True)
+        self.assertEqual(Task.objects.values_list('status', 'attempts').get(), ('failed', 2))
+
+    def test_claimed_task_is_not_claimed_twice_until_abandoned(self):
+        record_call.enqueue(args=['x'])
+        self.assertEqual(len(claim()), 1)
+        self.assertEqual(claim(), [])
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(len(claim()), 1)
+
+    def test_reclaimed_task_ignores_the_stale_claims_outcome(self):
+        record_call.enqueue(args=['x'])
+        [stale] = claim()
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        [current] = claim()
+        with self.assertLogs('shop.taskqueue', 'WARNING'):
+            execute(stale)
+        self.assertEqual(Task.objects.values_list('status', 'attempts').get(), ('running', 2))
+        execute(current)
+        self.assertEqual(Task.objects.values_list('status', 'result').get(), ('done', 'x'))
+
+    def test_finished_tasks_are_pruned(self):
+        record_call.enqueue(args=['old'], key='old')
+        always_fails.enqueue(max_attempts=1)
+        record_call.enqueue(args=['new'])
+        with self.assertLogs('shop.taskqueue', 'ERROR'):
+            Worker(concurrency=1).run(burst=True)
+        record_call.enqueue(args=['queued'], run_at=timezone.now() + timedelta(hours=1))
+        Task.objects.exclude(args=['new']).update(updated_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(prune(), 2)
+        self.assertEqual(sorted(Task.objects.values_list('status', flat=True)), ['done', 'queued'])
+        # The pruned task's key can be used again
+        record_call.enqueue(args=['again'], key='old')
+        Worker(concurrency=1).run(burst=True)
+        self.assertEqual(CALLS, ['old', 'new', 'again'])
+
+    def test_future_tasks_wait(self):
+        record_call.enqueue(args=['later'], run_at=timezone.now() + timedelta(hours=1))
+        Worker(concurrency=1).run(burst=True)
+        self.assertEqual(CALLS, [])
+
+    @override_settings(TASK_QUEUE_EAGER=True)
+    def test_eager_mode_runs_inline(self):
+        queued = enqueue(record_call.task_name, ['now'])
+        self.assertEqual(CALLS, ['now'])
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, 'done')
+
+
+@override_settings(IMAGE_DERIVATIVE_WIDTHS=[160, 320, 640, 1024])
+class WorkerPoolTests(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+        RELEASE.clear()
+        self.addCleanup(RELEASE.set)
+
+    def test_slow_task_does_not_hold_up_the_others(self):
+        wait_for_release.enqueue(priority=10)
+        for value in range(4):
+            record_call.enqueue(args=[value])
+        worker = Worker(concurrency=2, poll_interval=0.01)
+
+        def run():
+            try:
+                worker.run(burst=True)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        deadline = time.monotonic() + 10
+        while len(CALLS) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # All ran on the second thread while the first was still busy
+        self.assertEqual(sorted(CALLS), [0, 1, 2, 3])
+        self.assertEqual(Task.objects.get(name=wait_for_release.task_name).status, 'running')
+        RELEASE.set()
+        thread.join()
+        self.assertEqual(Task.objects.filter(status='done').count(), 5)
+
+
+class ImageDerivativeTests(TempMediaMixin, ShopTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.store, self.category = self.create_store()
+
+    def create_product_with_image(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGBA', (width, height), (200, 30, 30, 128)).save(buffer, 'PNG')
+        product = self.create_products(self.store, self.category, 1)[0]
+        product.image = SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+        product.save()
+        return product
+
+    def render(self, product):
+        return Template(
+            '{% load storefront %}{% responsive_image product.image alt="Photo" sizes="25vw" class="thumb" %}'
+        ).render(Context({'product': product}))
+
+    def test_derivatives_are_made_in_the_background(self):
+        product = self.create_product_with_image(800, 600)
+        self.assertIn(f'<img src="{product.image.url}"', self.render(product))
+
+        Worker(concurrency=1).run(burst=True)
+        for width in (160, 320, 640):
+            for extension in ('webp', 'jpg'):
+                name = product.image.name.rsplit('.', 1)[0] + f'.w{width}.{extension}'
+                self.assertTrue(default_storage.exists(name), name)
+                with default_storage.open(name) as derivative:
+                    self.assertEqual(Image.open(derivative).width, width)
+        self.assertFalse(default_storage.exists(product.image.name.rsplit('.', 1)[0] + '.w1024.jpg'))
+
+        html = self.render(product)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('.w320.webp 320w', html)
+        self.assertIn('.w640.jpg" srcset=', html)
+        self.assertIn('sizes="25vw" alt="Photo" loading="lazy" decoding="async" class="thumb"', html)
+
+    def test_missing_derivatives_are_looked_up_once(self):
+        product = self.create_product_with_image(800, 600)
+        self.render(product)
+        with self.assertNumQueries(0), patch.object(default_storage, 'exists') as exists:
+            self.assertNotIn('<picture>', self.render(product))
+        exists.assert_not_called()
+
+    def test_collected_image_uploaded_again_gets_new_derivatives(self):
+        product = self.create_product_with_image(800, 600)
+        name = product.image.name
+        Worker(concurrency=1).run(burst=True)
+        self.assertIn('<picture>', self.render(product))
+        data = default_storage.open(name).read()
+        product.image = None
+        product.save()
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(name))
+
+        product.image = SimpleUploadedFile('again.png', data, content_type='image/png')
+        product.save()
+        self.assertEqual(product.image.name, name)
+        Worker(concurrency=1).run(burst=True)
+        self.assertTrue(default_storage.exists(name.rsplit('.', 1)[0] + '.w320.webp'))
+        self.assertIn('<picture>', self.render(product))
+
+    def test_images_smaller_than_every_width_are_served_as_is(self):
+        product = self.create_product_with_image(100, 100)
+        Worker(concurrency=1).run(burst=True)
+        with self.assertNumQueries(0):
+            html = self.render(product)
+        self.assertNotIn('<picture>', html)
+
+
+class ContentAddressedStorageTests(TempMediaMixin, ShopTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store, self.category = self.create_store()
+
+    def upload(self, product, data, filename='photo.png'):
+        product.image = SimpleUploadedFile(filename, data, content_type='image/png')
+        product.save()
+        return product.image.name
+
+    def test_identical_uploads_share_one_blob(self):
+        first, second, third = self.create_products(self.store, self.category, 3)
+        name = self.upload(first, b'same bytes', 'a.png')
+        self.assertRegex(name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.upload(second, b'same bytes', 'b.PNG'), name)
+        self.assertNotEqual(self.upload(third, b'other bytes'), name)
+
+    def test_blobs_are_served_as_immutable(self):
+        name = self.upload(self.create_products(self.store, self.category, 1)[0], b'bytes')
+        response = serve_media(RequestFactory().get(f'/media/{name}'), name)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_only_images_and_stylesheets_are_served_inline(self):
+        for name, inline in [('products/a.png', True), ('themes/a.css', True), ('store_logos/a.svg', False),
+                             ('products/a.html', False), ('imports/1/products.csv', False)]:
+            stored = default_storage.save(name, SimpleUploadedFile(name, b'<svg onload="alert(1)"/>'))
+            response = serve_media(RequestFactory().get(f'/media/{stored}'), stored)
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+            self.assertEqual(response.get('Content-Disposition', '').startswith('attachment'), not inline, name)
+
+    def test_duplicate_upload_renews_the_gc_grace_period(self):
+        product = self.create_products(self.store, self.category, 1)[0]
+        name = self.upload(product, b'reused')
+        product.image = None
+        product.save()
+        old = time.time() - 3 * 24 * 3600
+        os.utime(default_storage.path(name), (old, old))
+
+        # Stored again, but not yet referenced by the record being saved
+        self.assertEqual(default_storage.save('products/again.png', SimpleUploadedFile('a.png', b'reused')), name)
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_gc_deletes_only_unreferenced_blobs(self):
+        kept, dropped = self.create_products(self.store, self.category, 2)
+        kept_name = self.upload(kept, b'kept')
+        dropped_name = self.upload(dropped, b'dropped')
+        derivative = dropped_name.replace('.png', '.w160.jpg')
+        default_storage.save(derivative, SimpleUploadedFile('d.jpg', b'derived'))
+        dropped.image = None
+        dropped.save()
+
+        call_command('gc_media', min_age=0, stdout=StringIO())
+        self.assertTrue(default_storage.exists(kept_name))
+        self.assertFalse(default_storage.exists(dropped_name))
+        self.assertFalse(default_storage.exists(derivative))
+
+
+class StoreThemeCompileTests(TempMediaMixin, ShopTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store, _ = self.create_store()
+
+    def css(self, theme):
+        with default_storage.open(theme.stylesheet.name) as stylesheet:
+            return stylesheet.read().decode()
+
+    def test_save_compiles_stylesheet_and_plan(self):
+        theme = StoreTheme.objects.create(store=self.store, primary_color='#123456')
+        self.assertRegex(theme.stylesheet.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.css$')
+        self.assertIn('--theme-primary: #123456;', self.css(theme))
+        self.assertEqual([section['type'] for section in theme.section_plan],
+                         ['hero_banner', 'product_grid', 'footer'])
+        self.assertEqual(theme.section_plan[1]['template'], 'shop/sections/product_grid.html')
+
+        name = theme.stylesheet.name
+        theme.save()
+        self.assertEqual(theme.stylesheet.name, name)
+        theme.primary_color = '#abcdef'
+        theme.save()
+        self.assertNotEqual(theme.stylesheet.name, name)
+
+    def test_unsafe_values_fall_back_to_defaults(self):
+        theme = StoreTheme.objects.create(
+            store=self.store, text_color='red;}', font_family='x; } body { display: none',
+        )
+        css = self.css(theme)
+        self.assertIn('--theme-text: #212529;', css)
+        self.assertIn('--theme-font: Arial, sans-serif;', css)
+
+    def test_sections_are_validated(self):
+        theme = StoreTheme(store=self.store, sections={'sections': [
+            {'id': 'grid', 'type': 'product_grid', 'settings': {'products_count': '500'}},
+            {'id': 'off', 'type': 'footer', 'enabled': False},
+        ]})
+        theme.save()
+        self.assertEqual(theme.section_plan, [{
+            'id': 'grid', 'type': 'product_grid', 'template': 'shop/sections/product_grid.html',
+            'settings': {'title': '', 'products_count': MAX_GRID_PRODUCTS},
+        }])
+
+        for sections in [{'sections': [{'type': 'marquee'}]}, {'sections': 'hero'},
+                         {'sections': [{'type': 'product_grid', 'settings': {'products_count': 'many'}}]}]:
+            with self.assertRaises(ThemeError):
+                section_plan(sections)
+        theme.sections = {'sections': [{'type': 'marquee'}]}
+        with self.assertRaises(ValidationError):
+            theme.full_clean()
+
+    def test_stylesheet_tag(self):
+        template = Template('{% load storefront %}{% theme_stylesheet store %}')
+        self.assertEqual(template.render(Context({'store': self.store})), '')
+        with self.captureOnCommitCallbacks(execute=True):
+            theme = StoreTheme.objects.create(store=self.store)
+        store = Store.objects.get(pk=self.store.pk)
+        self.assertEqual(template.render(Context({'store': store})),
+                         f'<link rel="stylesheet" href="{theme.stylesheet.url}">')
+
+
+class SectionRendererTests(TempMediaMixin, ShopTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 5)
+        self.theme = StoreTheme.objects.create(store=self.store, sections={'sections': [
+            {'id': 'hero', 'type': 'hero_banner', 'settings': {'title': 'Big Sale', 'button_text': 'Shop'}},
+            {'id': 'grid', 'type': 'product_grid', 'settings': {'products_count': 2}},
+            {'id': 'footer', 'type': 'footer', 'settings': {'text': 'Bye'}},
+        ]})
+
+    def render(self):
+        with patch('shop.sections.render_section', wraps=sections.render_section) as render_section:
+            html = sections.render_storefront(self.store)
+        return html, [call.args[1]['id'] for call in render_section.call_args_list]
+
+    def test_sections_render_in_order_and_are_cached(self):
+        html, rendered = self.render()
+        self.assertEqual(rendered, ['hero', 'grid', 'footer'])
+        self.assertLess(html.index('Big Sale'), html.index(self.products[-1].name))
+        self.assertLess(html.index(self.products[-1].name), html.index('Bye'))
+        # products_count: the two newest
+        self.assertNotIn(self.products[0].name, html)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.render(), (html, []))
+
+    def test_hero_button_links_to_the_product_grid(self):
+        html, _ = self.render()
+        self.assertIn('href="#grid-products"', html)
+        self.assertIn('id="grid-products"', html)
+
+        self.theme.sections['sections'][1]['enabled'] = False
+        self.theme.save()
+        self.assertNotIn('>Shop</a>', self.render()[0])
+
+    def test_sections_cached_as_empty_are_not_rerendered(self):
+        self.render()
+        plan = StoreTheme.objects.get(pk=self.theme.pk).section_plan
+        cache.set(sections.section_key(self.store, plan[2]), '')
+        html, rendered = self.render()
+        self.assertEqual(rendered, [])
+        self.assertNotIn('Bye', html)
+
+    def test_editing_a_section_rerenders_only_that_section(self):
+        self.render()
+        self.theme.sections['sections'][0]['settings']['title'] = 'Bigger Sale'
+        self.theme.save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, ['hero'])
+        self.assertIn('Bigger Sale', html)
+
+    def test_catalog_change_rerenders_only_product_grid(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[-1].name = 'Renamed Product'
+            self.products[-1].save()
+        html, rendered = self.render()
+        self.assertEqual(rendered, ['grid'])
+        self.assertIn('Renamed Product', html)
+
+    def test_store_landing_page_shows_sections(self):
+        self.store.domain = 'shop.example.com'
+        self.store.save()
+        response = self.client.get('/', HTTP_HOST='shop.example.com')
+        self.assertContains(response, 'Big Sale')
+        self.assertContains(response, f'<link rel="stylesheet" href="{self.theme.stylesheet.url}">', html=True)
+        self.assertNotContains(self.client.get('/?category=general', HTTP_HOST='shop.example.com'), 'Big Sale')
+
+
+class DataVersionTests(TempMediaMixin, ShopTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.store, self.category = self.create_store()
+
+    def test_entities_are_bumped_independently(self):
+        before = versions.get_versions(self.store.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=User.objects.create_user('buyer'), store=self.store,
+                                         total_amount=Decimal('1.00'), shipping_address='Here')
+        after_order = versions.get_versions(self.store.pk)
+        self.assertEqual(after_order[versions.CATALOG], before[versions.CATALOG])
+        self.assertEqual(after_order[versions.THEME], before[versions.THEME])
+        self.assertGreater(after_order[versions.ORDERS], before[versions.ORDERS])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = self.create_products(self.store, self.category, 1)[0]
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        after_item = versions.get_versions(self.store.pk)
+        self.assertGreater(after_item[versions.CATALOG], after_order[versions.CATALOG])
+        self.assertGreater(after_item[versions.ORDERS], after_order[versions.ORDERS])
+
+    def test_catalog_and_theme_bumps_wait_for_the_commit(self):
+        before = versions.get_versions(self.store.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                self.create_products(self.store, self.category, 1)
+                StoreTheme.objects.create(store=self.store)
+            # The outer (test) transaction is still open: nothing bumped yet
+            self.assertEqual(versions.get_versions(self.store.pk), before)
+        for callback in callbacks:
+            callback()
+        after = versions.get_versions(self.store.pk)
+        self.assertGreater(after[versions.CATALOG], before[versions.CATALOG])
+        self.assertGreater(after[versions.THEME], before[versions.THEME])
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.create_products(self.store, self.category, 1)
+                    raise DatabaseError('rolled back')
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(versions.get_versions(self.store.pk), after)
+
+    def test_versions_are_read_in_one_cache_call(self):
+        versions.get_versions(self.store.pk)
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                patch.object(versions, '_start') as start:
+            versions.get_versions(self.store.pk)
+        self.assertEqual(get_many.call_count, 1)
+        start.assert_not_called()
+
+    def test_last_modified_follows_bumps(self):
+        versions.get_versions(self.store.pk)
+        started = versions.last_modified(self.store.pk)
+        self.assertIsNotNone(started)
+        time.sleep(0.01)
+        versions.bump(self.store.pk, versions.THEME)
+        self.assertGreater(versions.last_modified(self.store.pk), started)
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['shop.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                             'LOCATION': 'redis://localhost:6379'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class ConditionalStorefrontTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store, self.category = self.create_store()
+        self.products = self.create_products(self.store, self.category, 2)
+        self.url = reverse('product_list')
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products[0].name = 'Renamed Product'
+            self.products[0].save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_cart_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.fill_cart(self.products[:1])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_logged_in_users_always_get_the_page(self):
+        self.client.force_login(User.objects.create_user('shopper'))
+        self.assertFalse(self.client.get(self.url).has_header('ETag'))
+
+
+class ProductPageStateTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store, self.category = self.create_store()
+        self.other_category = Category.objects.create(name='Other', store=self.store)
+        self.product, self.neighbour = self.create_products(self.store, self.category, 2)
+        self.other = Product.objects.create(name='Other Product', price=Decimal('5.00'), stock=1,
+                                            category=self.other_category, store=self.store)
+        self.detail_url = reverse('product_detail', args=[self.product.slug])
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return lambda: self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code
+
+    def test_unchanged_product_page_skips_the_view(self):
+        revalidate = self.revalidate(self.detail_url)
+        with self.assertNumQueries(0):
+            self.assertEqual(revalidate(), 304)
+
+    def test_page_cache_hit_does_not_query(self):
+        self.client.get(self.detail_url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.detail_url), self.product.name)
+
+    def test_changes_in_other_categories_keep_the_validators(self):
+        detail = self.revalidate(self.detail_url)
+        listing = self.revalidate(f'{reverse("product_list")}?category={self.category.slug}')
+        self.other.price = Decimal('99.00')
+        self.other.save()
+        self.assertEqual((detail(), listing()), (304, 304))
+
+    def test_changes_in_the_category_send_the_page(self):
+        detail = self.revalidate(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.neighbour.delete()
+        self.assertEqual(detail(), 200)
+
+        detail = self.revalidate(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 3
+            self.product.save()
+        self.assertEqual(detail(), 200)
+
+    def test_store_changes_send_the_page(self):
+        detail = self.revalidate(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.description = 'New description'
+            self.store.save()
+        self.assertEqual(detail(), 200)
+
+    def test_checkout_stock_change_sends_the_page(self):
+        detail = self.revalidate(self.detail_url)
+        listing = self.revalidate(reverse('product_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(User.objects.create_user('buyer'), {self.product.id: 3}, 'Somewhere')
+        self.assertEqual((detail(), listing()), (200, 200))
+
+    def test_missing_product_is_a_404(self):
+        url = reverse('product_detail', args=['no-such-product'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='*').status_code, 404)
+
+
+class RelatedProductTests(ShopTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store, self.category = self.create_store()
+        self.other_category = Category.objects.create(name='Other', store=self.store)
+        self.first, self.second, self.third = self.create_products(self.store, self.category, 3)
+        self.accessory = Product.objects.create(name='Accessory', price=Decimal('5.00'), stock=10,
+                                                category=self.other_category, store=self.store)
+        self.buyer = User.objects.create_user('buyer')
+
+    def order(self, *products):
+        order = Order.objects.create(user=self.buyer, store=self.store, total_amount=Decimal('1.00'),
+                                     shipping_address='Here')
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=product, quantity=1, price=product.price)
+                                      for product in products)
+
+    def related_ids(self, product):
+        return list(RelatedProduct.objects.filter(product=product).order_by('-score')
+                    .values_list('related_id', flat=True))
+
+    def test_ranked_by_co_occurrence_then_category(self):
+        for _ in range(3):
+            self.order(self.first, self.accessory)
+        self.order(self.first, self.second)
+        rebuild_related(self.store.pk)
+        # Bought together most, then bought together in the same category,
+        # then the rest of the category
+        self.assertEqual(self.related_ids(self.first), [self.accessory.id, self.second.id, self.third.id])
+        self.assertEqual(self.related_ids(self.accessory), [self.first.id])
+
+    def test_large_baskets_are_skipped(self):
+        counts, pairs = co_occurrence([set(range(MAX_BASKET_SIZE + 1)), {1, 2}])
+        self.assertEqual((counts, pairs), ({1: 1, 2: 1}, {(1, 2): 1}))
+
+    def test_rebuild_replaces_rows_and_drops_unavailable_products(self):
+        rebuild_related(self.store.pk)
+        self.third.available = False
+        self.third.save()
+        rebuild_related(self.store.pk)
+        self.assertEqual(self.related_ids(self.first), [self.second.id])
+        self.assertFalse(RelatedProduct.objects.filter(product=self.third).exists())
+
+    def test_product_page_reads_precomputed_neighbours(self):
+        self.order(self.first, self.accessory)
+        url = reverse('product_detail', args=[self.first.slug])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_related_products', stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['related_products'][0], self.accessory)
@@ -0,0 +1,169 @@
+"""
+Compiled store themes.
+
+When a StoreTheme is saved its settings are compiled once (see the pre_save
+signal) instead of on every request:
+
+- stylesheet: a CSS file built from the colours, font and layout. It is
+  named after its content, so its URL changes whenever the theme does and
+  browsers can cache it forever (stored as a blob, see shop.storage).
+- section_plan: the enabled sections, checked and filled in with defaults,
+  ready to render in order: [{'id', 'type', 'template', 'settings'}, ...].
+
+Colours and fonts that are not safe to put in CSS fall back to the model
+defaults; sections that can't be rendered raise ThemeError.
+"""
+import hashlib
+import re
+
+from django.core.files.base import ContentFile
+from django.template.loader import render_to_string
+
+COLOR_FIELDS = ['primary_color', 'secondary_color', 'background_color', 'text_color']
+COLOR_RE = re.compile(r'^#(?:[0-9a-fA-F]{3}){1,2}$')
+FONT_RE = re.compile(r'''^[\w\s,'"-]{1,100}$''')
+URL_RE = re.compile(r'^(?:https?://|/)', re.IGNORECASE)
+
+MAX_GRID_PRODUCTS = 48
+MAX_TEXT_LENGTH = 500
+
+# Settings each section type accepts, with their defaults
+SECTION_TYPES = {
+    'hero_banner': {'title': '', 'subtitle': '', 'button_text': '', 'background_image': ''},
+    'product_grid': {'title': '', 'products_count': 8},
+    'footer': {'text': '', 'social_links': []},
+}
+
+
+class ThemeError(ValueError):
+    pass
+
+
+def default_sections(store_name):
+    """Sections of a new theme"""
+    return {
+        'sections': [
+            {
+                'id': 'hero',
+                'type': 'hero_banner',
+                'enabled': True,
+                'settings': {
+                    'title': f'Welcome to {store_name}',
+                    'subtitle': 'Discover amazing products',
+                    'button_text': 'Shop Now',
+                    'background_image': '',
+                }
+            },
+            {
+                'id': 'featured_products',
+                'type': 'product_grid',
+                'enabled': True,
+                'settings': {
+                    'title': 'Featured Products',
+                    'products_count': 8,
+                }
+            },
+            {
+                'id': 'footer',
+                'type': 'footer',
+                'enabled': True,
+                'settings': {
+                    'text': f'© 2024 {store_name}. All rights reserved.',
+                    'social_links': []
+                }
+            }
+        ]
+    }
+
+
+def _field_default(theme, name):
+    return theme._meta.get_field(name).default
+
+
+def compile_css(theme):
+    """The theme's stylesheet as a string"""
+    values = {}
+    for name in COLOR_FIELDS:
+        value = getattr(theme, name)
+        values[name] = value if COLOR_RE.match(value or '') else _field_default(theme, name)
+    font = theme.font_family
+    values['font_family'] = font if FONT_RE.match(font or '') else _field_default(theme, 'font_family')
+    values['fluid'] = theme.layout_width == 'fluid'
+    return render_to_string('shop/theme.css', values)
+
+
+def _clean_setting(section_type, name, value, default):
+    if name == 'products_count':
+        try:
+            count = int(value)
+        except (TypeError, ValueError):
+            raise ThemeError(f'{section_type}: products_count must be a number')
+        return max(1, min(count, MAX_GRID_PRODUCTS))
+    if name == 'social_links':
+        if not isinstance(value, list):
+            raise ThemeError(f'{section_type}: social_links must be a list')
+        return [str(link)[:MAX_TEXT_LENGTH] for link in value if URL_RE.match(str(link))]
+    if isinstance(value, (dict, list)):
+        raise ThemeError(f'{section_type}: {name} must be text')
+    if name == 'background_image' and value and not URL_RE.match(str(value)):
+        return ''
+    return str(value if value is not None else default)[:MAX_TEXT_LENGTH]
+
+
+def section_plan(sections):
+    """
+    Validate a theme's sections ({'sections': [...]} or the list itself) and
+    return the enabled ones, in order, with complete settings. Hero banners
+    get a 'target': the anchor of the first product grid their button links to.
+    """
+    if isinstance(sections, dict):
+        sections = sections.get('sections', [])
+    if not isinstance(sections, list):
+        raise ThemeError('sections must be a list')
+
+    plan = []
+    seen = set()
+    for index, section in enumerate(sections):
+        if not isinstance(section, dict):
+            raise ThemeError(f'section {index + 1} is not an object')
+        section_type = section.get('type')
+        if section_type not in SECTION_TYPES:
+            raise ThemeError(f'unknown section type {section_type!r}')
+        section_id = str(section.get('id') or f'{section_type}-{index + 1}')
+        if section_id in seen:
+            raise ThemeError(f'duplicate section id {section_id!r}')
+        seen.add(section_id)
+        if not section.get('enabled', True):
+            continue
+        settings = section.get('settings') or {}
+        if not isinstance(settings, dict):
+            raise ThemeError(f'{section_type}: settings must be an object')
+        plan.append({
+            'id': section_id,
+            'type': section_type,
+            'template': f'shop/sections/{section_type}.html',
+            'settings': {
+                name: _clean_setting(section_type, name, settings.get(name, default), default)
+                for name, default in SECTION_TYPES[section_type].items()
+            },
+        })
+
+    grids = [section['id'] for section in plan if section['type'] == 'product_grid']
+    for section in plan:
+        if section['type'] == 'hero_banner':
+            section['target'] = f'{grids[0]}-products' if grids else ''
+    return plan
+
+
+def compile_theme(theme):
+    """
+    Refresh theme.stylesheet and theme.section_plan (the caller saves).
+    Works on migrations' historical StoreTheme models too.
+    """
+    theme.section_plan = section_plan(theme.sections or default_sections(theme.store.name))
+
+    css = compile_css(theme).encode()
+    digest = hashlib.sha256(css).hexdigest()
+    if theme.stylesheet and digest in theme.stylesheet.name:
+        return
+    theme.stylesheet.save(f'theme-{digest}.css', ContentFile(css), save=False)
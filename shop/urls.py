@@ -8,6 +8,10 @@ urlpatterns = [
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/update/<int:product_id>/', views.update_cart, name='update_cart'),
     path('cart/remove/<int:product_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/api/', views.cart_summary, name='cart_summary'),
+    path('cart/api/add/', views.cart_add, name='cart_add'),
+    path('cart/api/update/', views.cart_update, name='cart_update'),
+    path('cart/api/remove/', views.cart_remove, name='cart_remove'),
     path('checkout/', views.checkout, name='checkout'),
     path('order/<int:order_id>/success/', views.order_success, name='order_success'),
     path('my-orders/', views.my_orders, name='my_orders'),
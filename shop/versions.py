@@ -0,0 +1,97 @@
+"""
+Per-store data versions for building cache keys.
+
+Each store has a version number in the cache per kind of data (entity) that
+changes whenever that data changes, plus a global version per entity that
+changes with any store's:
+
+- catalog: products, categories, store details
+- orders: orders and their items
+- theme: the store's StoreTheme
+
+Cache keys that include the versions they depend on go stale automatically,
+so nothing has to find and delete them. Every bump also records when it
+happened, for Last-Modified headers. Model changes bump after their
+transaction commits (bump_on_commit).
+
+The versions live in the default cache, so it must be shared by all web and
+worker processes (see shop/checks.py).
+
+Versions start from the current time in nanoseconds, so if a version is
+evicted from the cache the replacement is still newer than anything that
+was built from the old one.
+"""
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+KEY_PREFIX = 'shop:version'
+GLOBAL = 'global'
+
+CATALOG = 'catalog'
+ORDERS = 'orders'
+THEME = 'theme'
+ENTITIES = [CATALOG, ORDERS, THEME]
+
+# Versions outlive anything keyed on them
+VERSION_TIMEOUT = None
+
+
+def _key(store_id, entity=CATALOG):
+    return f'{KEY_PREFIX}:{entity}:{GLOBAL if store_id is None else store_id}'
+
+
+def _modified_key(key):
+    return f'{key}:modified'
+
+
+def _start(key):
+    """Create a missing version; a lost one counts as changed now"""
+    version = time.time_ns()
+    if not cache.add(key, version, VERSION_TIMEOUT):
+        return cache.get(key, version)
+    cache.set(_modified_key(key), version / 1e9, VERSION_TIMEOUT)
+    return version
+
+
+def get_version(store_id=None, entity=CATALOG):
+    """Return a store's version of `entity`, or the global one for None"""
+    key = _key(store_id, entity)
+    version = cache.get(key)
+    return _start(key) if version is None else version
+
+
+def get_versions(store_id=None, entities=ENTITIES):
+    """{entity: version} for several entities in one cache round trip"""
+    keys = {entity: _key(store_id, entity) for entity in entities}
+    found = cache.get_many(keys.values())
+    return {entity: found[key] if key in found else _start(key) for entity, key in keys.items()}
+
+
+def last_modified(store_id=None, entities=ENTITIES):
+    """Unix time of the latest change to any of `entities`, None if unknown"""
+    keys = [_modified_key(_key(store_id, entity)) for entity in entities]
+    found = cache.get_many(keys)
+    return max(found.values()) if len(found) == len(keys) else None
+
+
+def bump(store_id, entity=CATALOG):
+    """Mark a store's `entity` (and the global one) as changed"""
+    now = time.time()
+    for key in (_key(store_id, entity), _key(GLOBAL, entity)):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), VERSION_TIMEOUT)
+        cache.set(_modified_key(key), now, VERSION_TIMEOUT)
+
+
+def bump_on_commit(store_id, entity=CATALOG):
+    """
+    bump() once the current transaction commits (at once outside of one), so
+    a request that reads the new version also sees the new rows, and a
+    rolled-back change invalidates nothing
+    """
+    transaction.on_commit(partial(bump, store_id, entity))
@@ -1,90 +1,117 @@
+import json
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login
-from .models import Product, Category, Order, OrderItem
-from decimal import Decimal
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_GET, require_POST
+from .models import Product, Category, Order
+from .cart import MAX_LINES, cart_state, hydrate_cart
+from .checkout import place_order, CheckoutError, OutOfStock
+from .pagination import paginate_keyset, InvalidCursor
+from .related import related_products
+from .search import search_page
+from .conditional import catalog_state, page_state, product_state
+from .page_cache import cache_storefront_page
+from .sections import render_storefront
+from . import versions
+
+
+PRODUCTS_PER_PAGE = 24
+ORDERS_PER_PAGE = 20
+RELATED_PER_PAGE = 4
 
 
+def _product_list_state(request):
+    store = getattr(request, 'store', None) or None
+    return catalog_state(store.pk if store else None, request.GET.get('category'))
+
+
+@page_state(_product_list_state)
+@cache_storefront_page
 def product_list(request):
-    """Display all available products"""
-    products = Product.objects.filter(available=True)
+    """Display available products, one keyset-paginated page at a time"""
+    products = Product.objects.filter(available=True).select_related('category')
     categories = Category.objects.all()
     
-    # Filter by category if specified
+    # On a store's custom domain only show that store's catalog
+    store = getattr(request, 'store', None) or None  # unwrap a lazy None
+    if store:
+        products = products.filter(store=store)
+        categories = categories.filter(store=store)
+    
+    # Filter by category if specified (slugs are only unique per store)
     category_slug = request.GET.get('category')
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+        products = products.filter(category__slug=category_slug)
     
-    # Search functionality
+    # Search functionality: ranked full-text results, paged by offset
     search_query = request.GET.get('search')
-    if search_query:
-        products = products.filter(name__icontains=search_query)
+    try:
+        if search_query:
+            filters = {'store': store, 'available': True}
+            if category_slug:
+                filters['category_ids'] = list(
+                    categories.filter(slug=category_slug).values_list('id', flat=True)
+                )
+            page = search_page(search_query, request.GET.get('after'), PRODUCTS_PER_PAGE, **filters)
+        else:
+            page = paginate_keyset(products, request.GET.get('after'), per_page=PRODUCTS_PER_PAGE)
+    except InvalidCursor:
+        raise Http404('Invalid page')
     
     return render(request, 'shop/product_list.html', {
-        'products': products,
+        'products': page,
+        'page': page,
         'categories': categories,
-        'current_category': category_slug
+        'current_category': category_slug,
+        'catalog_version': versions.get_version(store.pk if store else None),
+        # A store's landing page opens with its theme's sections
+        'store_sections': render_storefront(store) if store and not (
+            category_slug or search_query or request.GET.get('after')
+        ) else '',
     })
 
 
+def _product_detail_state(request, slug):
+    store = getattr(request, 'store', None) or None
+    return product_state(store.pk if store else None, slug)
+
+
+@page_state(_product_detail_state)
+@cache_storefront_page
 def product_detail(request, slug):
     """Display product details"""
     product = get_object_or_404(Product, slug=slug, available=True)
-    related_products = Product.objects.filter(
-        category=product.category,
-        available=True
-    ).exclude(id=product.id)[:4]
+    related = related_products(product, RELATED_PER_PAGE)
+    if not related:
+        # Not computed yet (e.g. a new product): newest in the category
+        related = Product.objects.filter(
+            store_id=product.store_id,
+            category_id=product.category_id,
+            available=True
+        ).exclude(id=product.id).order_by('-created_at', '-id')[:RELATED_PER_PAGE]
     
     return render(request, 'shop/product_detail.html', {
         'product': product,
-        'related_products': related_products
+        'related_products': related
     })
 
 
 def add_to_cart(request, product_id):
     """Add product to cart"""
-    product = get_object_or_404(Product, id=product_id)
-    cart = request.session.get('cart', {})
-    
-    # Add or increment quantity
-    product_id_str = str(product_id)
-    if product_id_str in cart:
-        cart[product_id_str]['quantity'] += 1
-    else:
-        cart[product_id_str] = {
-            'quantity': 1,
-            'price': str(product.price),
-            'name': product.name
-        }
-    
-    request.session['cart'] = cart
-    request.session.modified = True
+    product = get_object_or_404(Product.objects.only('id', 'name'), id=product_id)
+    request.cart.add(product.id)
     messages.success(request, f'{product.name} added to cart!')
     return redirect('product_list')
 
 
 def view_cart(request):
     """Display shopping cart"""
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total = Decimal('0.00')
-    
-    for product_id, item_data in cart.items():
-        try:
-            product = Product.objects.get(id=int(product_id))
-            quantity = item_data['quantity']
-            subtotal = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            total += subtotal
-        except Product.DoesNotExist:
-            continue
+    cart_items, total = hydrate_cart(request.cart)
     
     return render(request, 'shop/cart.html', {
         'cart_items': cart_items,
@@ -94,44 +121,117 @@ def view_cart(request):
 
 def update_cart(request, product_id):
     """Update cart item quantity"""
-    if request.method == 'POST':
-        cart = request.session.get('cart', {})
-        product_id_str = str(product_id)
-        quantity = int(request.POST.get('quantity', 1))
-        
+    if request.method == 'POST' and product_id in request.cart:
+        try:
+            quantity = int(request.POST.get('quantity', 1))
+        except ValueError:
+            quantity = request.cart.quantity(product_id)
+        request.cart.set(product_id, quantity)
         if quantity > 0:
-            if product_id_str in cart:
-                cart[product_id_str]['quantity'] = quantity
-                messages.success(request, 'Cart updated!')
+            messages.success(request, 'Cart updated!')
         else:
-            if product_id_str in cart:
-                del cart[product_id_str]
-                messages.success(request, 'Item removed from cart!')
-        
-        request.session['cart'] = cart
-        request.session.modified = True
+            messages.success(request, 'Item removed from cart!')
     
     return redirect('view_cart')
 
 
 def remove_from_cart(request, product_id):
     """Remove item from cart"""
-    cart = request.session.get('cart', {})
-    product_id_str = str(product_id)
-    
-    if product_id_str in cart:
-        del cart[product_id_str]
-        request.session['cart'] = cart
-        request.session.modified = True
+    if product_id in request.cart:
+        request.cart.remove(product_id)
         messages.success(request, 'Item removed from cart!')
     
     return redirect('view_cart')
 
 
+# Largest id a bigint primary key can hold
+MAX_PRODUCT_ID = 2 ** 63 - 1
+
+
+def _api_int(value):
+    """An int from a JSON integer or a numeric form value; ValueError for anything else"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError('Product ids and quantities must be integers')
+    return int(value)
+
+
+def _cart_api_lines(request):
+    """
+    {product_id: quantity} from a cart API request: a JSON body with
+    "lines": {"12": 2, ...} (or "product_ids": [...] / "product_id"), or the
+    same as form fields. Raises ValueError on malformed input.
+    """
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or '{}')
+        except ValueError:
+            raise ValueError('Invalid JSON')
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+    else:
+        data = request.POST.dict()
+
+    if 'lines' in data:
+        lines = data['lines']
+        if not isinstance(lines, dict):
+            raise ValueError('"lines" must be an object')
+        lines = list(lines.items())
+    elif 'product_ids' in data:
+        if not isinstance(data['product_ids'], list):
+            raise ValueError('"product_ids" must be a list')
+        lines = [(product_id, 0) for product_id in data['product_ids']]
+    elif 'product_id' in data:
+        lines = [(data['product_id'], data.get('quantity', 1))]
+    else:
+        raise ValueError('No cart lines given')
+    if not lines or len(lines) > MAX_LINES:
+        raise ValueError(f'Expected between 1 and {MAX_LINES} lines')
+    lines = {_api_int(product_id): _api_int(quantity) for product_id, quantity in lines}
+    if not all(0 < product_id <= MAX_PRODUCT_ID for product_id in lines):
+        raise ValueError('Unknown product id')
+    return lines
+
+
+def _apply_cart_lines(request, apply):
+    """Run apply(product_id, quantity) per requested line; respond with those lines"""
+    try:
+        lines = _cart_api_lines(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    for product_id, quantity in lines.items():
+        apply(product_id, quantity)
+    return JsonResponse(cart_state(request.cart, list(lines)))
+
+
+@require_GET
+@ensure_csrf_cookie
+def cart_summary(request):
+    """Cart API: every line, with counts and total (also sets the CSRF cookie)"""
+    return JsonResponse(cart_state(request.cart))
+
+
+@require_POST
+def cart_add(request):
+    """Cart API: add quantities to lines"""
+    return _apply_cart_lines(request, request.cart.add)
+
+
+@require_POST
+def cart_update(request):
+    """Cart API: set line quantities (0 removes)"""
+    return _apply_cart_lines(request, request.cart.set)
+
+
+@require_POST
+def cart_remove(request):
+    """Cart API: remove lines"""
+    return _apply_cart_lines(request, lambda product_id, quantity: request.cart.remove(product_id))
+
+
 @login_required
 def checkout(request):
     """Process checkout"""
-    cart = request.session.get('cart', {})
+    cart = request.cart
     
     if not cart:
         messages.warning(request, 'Your cart is empty!')
@@ -144,78 +244,29 @@ def checkout(request):
             messages.error(request, 'Please provide a shipping address!')
             return render(request, 'shop/checkout.html')
         
-        # Calculate total
-        total = Decimal('0.00')
-        order_items_data = []
-        first_product_store = None
-        
-        for product_id, item_data in cart.items():
-            try:
-                product = Product.objects.get(id=int(product_id))
-                quantity = item_data['quantity']
-                
-                # Check stock
-                if product.stock < quantity:
-                    messages.error(request, f'Not enough stock for {product.name}!')
-                    return redirect('view_cart')
-                
-                if first_product_store is None:
-                    first_product_store = product.store
-                
-                subtotal = product.price * quantity
-                total += subtotal
-                order_items_data.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'price': product.price
-                })
-            except Product.DoesNotExist:
-                continue
-        
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            store=first_product_store,
-            total_amount=total,
-            shipping_address=shipping_address,
-            status='pending'
-        )
-        
-        # Create order items and update stock
-        for item_data in order_items_data:
-            OrderItem.objects.create(
-                order=order,
-                product=item_data['product'],
-                quantity=item_data['quantity'],
-                price=item_data['price']
-            )
-            item_data['product'].stock -= item_data['quantity']
-            item_data['product'].save()
+        try:
+            orders = place_order(request.user, cart, shipping_address)
+        except OutOfStock as e:
+            messages.error(request, str(e))
+            return redirect('view_cart')
+        except CheckoutError as e:
+            messages.warning(request, str(e))
+            return redirect('product_list')
         
         # Clear cart
-        request.session['cart'] = {}
-        request.session.modified = True
+        cart.clear()
+        
+        if len(orders) == 1:
+            messages.success(request, f'Order #{orders[0].id} placed successfully!')
+            return redirect('order_success', order_id=orders[0].id)
         
-        messages.success(request, f'Order #{order.id} placed successfully!')
-        return redirect('order_success', order_id=order.id)
+        # Carts spanning several stores become one order per store
+        order_numbers = ', '.join(f'#{order.id}' for order in orders)
+        messages.success(request, f'Orders {order_numbers} placed successfully!')
+        return redirect('my_orders')
     
     # GET request - show checkout form
-    cart_items = []
-    total = Decimal('0.00')
-    
-    for product_id, item_data in cart.items():
-        try:
-            product = Product.objects.get(id=int(product_id))
-            quantity = item_data['quantity']
-            subtotal = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            total += subtotal
-        except Product.DoesNotExist:
-            continue
+    cart_items, total = hydrate_cart(cart)
     
     return render(request, 'shop/checkout.html', {
         'cart_items': cart_items,
@@ -232,9 +283,13 @@ def order_success(request, order_id):
 
 @login_required
 def my_orders(request):
-    """Display user's orders"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'shop/my_orders.html', {'orders': orders})
+    """Display user's orders, a page at a time, without per-order queries"""
+    orders = Order.objects.filter(user=request.user).with_items()
+    try:
+        page = paginate_keyset(orders, request.GET.get('after'), per_page=ORDERS_PER_PAGE)
+    except InvalidCursor:
+        raise Http404('Invalid page')
+    return render(request, 'shop/my_orders.html', {'orders': page, 'page': page})
 
 
 def register(request):
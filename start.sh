@@ -0,0 +1,16 @@
+#!/bin/bash
+
+# Web server and background task worker (shop/taskqueue.py) side by side in
+# one service: tasks (imports, image resizing) read and write the uploads in
+# MEDIA_ROOT, which only this service's disk holds. If either process exits,
+# both are stopped so the platform restarts the service.
+
+python manage.py run_worker &
+worker=$!
+gunicorn myshop.wsgi:application --bind "0.0.0.0:${PORT:-8000}" &
+web=$!
+
+trap 'kill -TERM $web $worker 2>/dev/null' TERM INT
+wait -n
+kill -TERM $web $worker 2>/dev/null
+wait